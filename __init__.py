@@ -1 +1,3 @@
-from . import models
\ No newline at end of file
+from . import controllers
+from . import models
+from . import wizard
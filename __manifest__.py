@@ -10,10 +10,16 @@
     'data': [
 
         # Sequence: security, data, wizards, views
+        'security/ir.model.access.csv',
+        'security/licence_expiration_report_security.xml',
+        'wizard/licence_expiration_report_export_views.xml',
+        'wizard/licence_expiration_report_replay_views.xml',
         'views/license_expiration_report.xml',
         'views/licence_length_months.xml',
         'views/res_config_settings_views.xml',
         'views/sale_order_line.xml',
+        'views/licence_expiration_report_run_views.xml',
+        'views/licence_expiration_report_line_views.xml',
     ],
     'demo': [],
     'qweb': [],
@@ -0,0 +1,114 @@
+from odoo import api, fields, http, registry
+from odoo.http import request, content_disposition
+from ..models.res_config_settings import parse_time_checkpoints
+from werkzeug.exceptions import BadRequest, Forbidden
+from datetime import date
+import csv
+import io
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Size of the blocks an XLSX file is streamed in
+XLSX_STREAM_BLOCK_SIZE = 64 * 1024
+
+
+class LicenceExpirationReportController(http.Controller):
+
+    @http.route('/licence_expiration_report/export', type='http', auth='user', methods=['GET'])
+    def export_licence_expiration_report(self, as_of=None, horizon=None, checkpoints=None, file_format='xlsx', **kwargs):
+        """
+        Streams the licence expiration report as of a date, either for every licence expiring within
+        horizon days or for the given comma separated checkpoints, as CSV or XLSX.
+        Only the lines of the companies selected by the user are exported.
+        """
+        if not request.env.user.has_group('sales_team.group_sale_manager'):
+            raise Forbidden()
+        if file_format not in ('csv', 'xlsx'):
+            raise BadRequest('Unsupported file format')
+
+        try:
+            as_of_date = fields.Date.to_date(as_of) if as_of else date.today()
+            if horizon:
+                time_checkpoints = request.env['account.move'].get_horizon_checkpoints(
+                    int(horizon))
+            else:
+                time_checkpoints, invalid_entries = parse_time_checkpoints(
+                    checkpoints)
+                if invalid_entries:
+                    raise ValueError(
+                        f"Invalid checkpoints: {', '.join(invalid_entries)}")
+        except ValueError as e:
+            raise BadRequest(str(e))
+        if not time_checkpoints:
+            raise BadRequest('No horizon or checkpoints given')
+
+        file_name = f"Licence Expiration Report {as_of_date.strftime('%Y-%m-%d')}.{file_format}"
+        if file_format == 'csv':
+            content_type = 'text/csv; charset=utf-8'
+            stream = self._stream_csv(
+                as_of_date, time_checkpoints, request.env.companies.ids)
+        else:
+            content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            stream = self._stream_xlsx(
+                as_of_date, time_checkpoints, request.env.companies.ids)
+
+        response = request.make_response(stream, headers=[
+            ('Content-Type', content_type),
+            ('Content-Disposition', content_disposition(file_name)),
+        ])
+        response.direct_passthrough = True
+        return response
+
+    def _report_env(self):
+        """
+        The request cursor is closed once the response is returned, so the streaming generators
+        open their own cursor with the same user and context, within their own environment scope
+        as they run after the dispatcher has left its api.Environment.manage() block.
+        """
+        return request.env.cr.dbname, request.env.uid, dict(request.env.context)
+
+    def _stream_csv(self, as_of_date, time_checkpoints, company_ids):
+        dbname, uid, context = self._report_env()
+
+        def generate():
+            with api.Environment.manage(), registry(dbname).cursor() as cr:
+                report = api.Environment(cr, uid, context)['account.move']
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(report.HEADER_VALUES_LIST)
+                for row_index, report_row in enumerate(report.get_export_rows(as_of_date, time_checkpoints, company_ids), 1):
+                    writer.writerow(report_row.values)
+                    # Flushing every chunk of rows keeps the download going while rows are produced
+                    if row_index % report.REPORT_CHUNK_SIZE == 0:
+                        yield buffer.getvalue().encode('utf-8')
+                        buffer.seek(0)
+                        buffer.truncate()
+                yield buffer.getvalue().encode('utf-8')
+
+        return generate()
+
+    def _stream_xlsx(self, as_of_date, time_checkpoints, company_ids):
+        """
+        An XLSX file is a zip archive that can only be sent once complete, so it is written
+        in constant memory mode to a temporary file and then streamed from disk.
+        """
+        dbname, uid, context = self._report_env()
+
+        def generate():
+            with api.Environment.manage(), registry(dbname).cursor() as cr:
+                report = api.Environment(cr, uid, context)['account.move']
+                settings = report.get_report_settings()._replace(
+                    xlsx_constant_memory=True)
+                workbook_state = report.open_xlsx_workbook(
+                    settings, as_of_date)
+                for report_row in report.get_export_rows(as_of_date, time_checkpoints, company_ids):
+                    report.write_xlsx_row(workbook_state, report_row)
+            workbook_state['workbook'].close()
+
+            with workbook_state['output'] as output:
+                output.seek(0)
+                for block in iter(lambda: output.read(XLSX_STREAM_BLOCK_SIZE), b''):
+                    yield block
+
+        return generate()
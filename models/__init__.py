@@ -1,2 +1,9 @@
+from . import account_move_line
+from . import licence_expiration_report_ledger
+from . import licence_expiration_report_line
+from . import licence_expiration_report_run
 from . import license_expiration_report
+from . import licence_expiration_report_snapshot
+from . import product_product
 from . import res_config_settings
+from . import sale_order_line
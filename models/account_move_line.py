@@ -0,0 +1,128 @@
+from odoo import api, fields, models
+from odoo.tools.sql import column_exists, create_column
+import dateutil.relativedelta
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class AccountMoveLine(models.Model):
+    _inherit = 'account.move.line'
+
+    licence_expiration_date = fields.Date(
+        string='Licence Expiration Date', compute='_compute_licence_expiration_date',
+        store=True, index=True, copy=False,
+        help='Invoice date plus the licence length of the product. Empty for non-licensed products.')
+    licence_renewal_line_id = fields.Many2one(
+        'account.move.line', string='Renewed By', index=True, readonly=True, copy=False, ondelete='set null',
+        help='Later invoice line for the same product and delivery address that renews this licence')
+
+    @api.depends('move_id.invoice_date', 'product_id.x_licence_length_months')
+    def _compute_licence_expiration_date(self):
+        for line in self:
+            licence_length_months = line.product_id.x_licence_length_months
+            if line.move_id.invoice_date and licence_length_months and licence_length_months > 0:
+                line.licence_expiration_date = line.move_id.invoice_date + \
+                    dateutil.relativedelta.relativedelta(
+                        months=licence_length_months)
+            else:
+                line.licence_expiration_date = False
+
+    def _auto_init(self):
+        """
+        Creates and fills the column in SQL on install, so the ORM does not have to
+        compute the expiration date line by line over the whole invoice history.
+        """
+        if not column_exists(self.env.cr, 'account_move_line', 'licence_expiration_date'):
+            create_column(self.env.cr, 'account_move_line',
+                          'licence_expiration_date', 'date')
+            self._backfill_licence_expiration_date()
+        if not column_exists(self.env.cr, 'account_move_line', 'licence_renewal_line_id'):
+            create_column(self.env.cr, 'account_move_line',
+                          'licence_renewal_line_id', 'int4')
+            self._update_licence_renewal_index()
+        return super()._auto_init()
+
+    def _backfill_licence_expiration_date(self):
+        """
+        Recomputes the stored expiration date of all historical invoice lines in one statement.
+        Postgres month arithmetic clamps to the end of the month, same as relativedelta.
+        """
+        self.env.cr.execute("""
+            UPDATE account_move_line aml
+               SET licence_expiration_date = CASE
+                       WHEN am.invoice_date IS NOT NULL AND pp.x_licence_length_months > 0
+                       THEN (am.invoice_date + pp.x_licence_length_months * INTERVAL '1 month')::date
+                   END
+              FROM account_move am, product_product pp
+             WHERE am.id = aml.move_id
+               AND pp.id = aml.product_id
+        """)
+        _logger.info('Licence expiration date backfilled on %s invoice lines',
+                     self.env.cr.rowcount)
+        return True
+
+    def _update_licence_renewal_index(self, renewal_line_ids=None, renewed_line_ids=None):
+        """
+        Links licensed lines that have no renewal yet to the earliest later posted customer invoice line
+        for the same product and delivery address, in one statement.
+        renewal_line_ids and renewed_line_ids restrict the candidate renewal and renewed lines,
+        the whole invoice history is indexed without them.
+        Returns the ids of the lines that got linked.
+        """
+        self.env['account.move.line'].flush()
+        self.env['account.move'].flush()
+        self.env.cr.execute("""
+            UPDATE account_move_line renewed
+               SET licence_renewal_line_id = renewal.renewal_line_id
+              FROM (
+                    SELECT DISTINCT ON (old_line.id) old_line.id AS renewed_line_id,
+                           new_line.id AS renewal_line_id
+                      FROM account_move_line new_line
+                      JOIN account_move new_move ON new_move.id = new_line.move_id
+                      JOIN account_move_line old_line ON old_line.product_id = new_line.product_id
+                      JOIN account_move old_move ON old_move.id = old_line.move_id
+                     WHERE new_move.state = 'posted'
+                       AND new_move.move_type = 'out_invoice'
+                       AND NOT new_line.exclude_from_invoice_tab
+                       AND new_line.licence_expiration_date IS NOT NULL
+                       AND old_move.state = 'posted'
+                       AND old_move.move_type = 'out_invoice'
+                       AND NOT old_line.exclude_from_invoice_tab
+                       AND old_line.licence_expiration_date IS NOT NULL
+                       AND old_line.licence_renewal_line_id IS NULL
+                       AND old_move.partner_shipping_id = new_move.partner_shipping_id
+                       AND old_move.invoice_date < new_move.invoice_date
+                       AND (%(renewal_line_ids)s::int[] IS NULL OR new_line.id = ANY(%(renewal_line_ids)s::int[]))
+                       AND (%(renewed_line_ids)s::int[] IS NULL OR old_line.id = ANY(%(renewed_line_ids)s::int[]))
+                     ORDER BY old_line.id, new_move.invoice_date, new_line.id
+                   ) renewal
+             WHERE renewed.id = renewal.renewed_line_id
+         RETURNING renewed.id
+        """, {
+            'renewal_line_ids': list(renewal_line_ids) if renewal_line_ids is not None else None,
+            'renewed_line_ids': list(renewed_line_ids) if renewed_line_ids is not None else None,
+        })
+        renewed_ids = [row[0] for row in self.env.cr.fetchall()]
+        self.invalidate_cache(['licence_renewal_line_id'])
+        return renewed_ids
+
+    def _clear_licence_renewal_index(self):
+        """
+        Unlinks the licences renewed by these lines, e.g. when their invoice is cancelled, and links
+        them to another renewal line if there is one. Returns the ids of the unlinked lines.
+        """
+        if not self:
+            return []
+        self.flush()
+        self.env.cr.execute("""
+            UPDATE account_move_line
+               SET licence_renewal_line_id = NULL
+             WHERE licence_renewal_line_id = ANY(%s)
+         RETURNING id
+        """, (self.ids,))
+        unlinked_ids = [row[0] for row in self.env.cr.fetchall()]
+        self.invalidate_cache(['licence_renewal_line_id'])
+        if unlinked_ids:
+            self._update_licence_renewal_index(renewed_line_ids=unlinked_ids)
+        return unlinked_ids
@@ -0,0 +1,60 @@
+from odoo import api, fields, models
+from psycopg2.extras import execute_values
+
+
+class LicenceExpirationReportLedger(models.Model):
+    _name = 'licence.expiration.report.ledger'
+    _description = 'Licence Expiration Report Ledger'
+    _order = 'notified_date desc, id desc'
+    _rec_name = 'inv_line_id'
+
+    inv_line_id = fields.Many2one(
+        'account.move.line', string='Invoice Line', required=True, index=True, ondelete='cascade')
+    checkpoint = fields.Integer(
+        string='Checkpoint (Days)', required=True,
+        help='Time checkpoint at which the invoice line was reported')
+    expiration_date = fields.Date(string='Expiration Date')
+    notified_date = fields.Date(
+        string='Notified On', required=True, default=fields.Date.context_today)
+    state = fields.Selection([
+        ('staged', 'Staged'),
+        ('sent', 'Sent'),
+    ], string='Status', required=True, default='sent', index=True,
+        help='Staged lines were found by a chunk of the current run and are waiting for the report email')
+
+    _sql_constraints = [
+        ('inv_line_checkpoint_uniq', 'unique(inv_line_id, checkpoint)',
+         'An invoice line can only be reported once per checkpoint.'),
+    ]
+
+    @api.model
+    def record_notified_lines(self, notified_lines, notified_date, state='sent'):
+        """
+        Records (inv_line_id, checkpoint, expiration_date) tuples as reported in one statement.
+        Pairs that are already in the ledger are left untouched.
+        """
+        if not notified_lines:
+            return
+        self.flush()
+        execute_values(self.env.cr, """
+            INSERT INTO licence_expiration_report_ledger
+                   (inv_line_id, checkpoint, expiration_date, notified_date, state,
+                    create_uid, create_date, write_uid, write_date)
+            VALUES %s
+            ON CONFLICT (inv_line_id, checkpoint) DO NOTHING
+        """, [
+            (inv_line_id, checkpoint, expiration_date, notified_date, state,
+             self.env.uid, fields.Datetime.now(), self.env.uid, fields.Datetime.now())
+            for inv_line_id, checkpoint, expiration_date in notified_lines
+        ], page_size=1000)
+        self.invalidate_cache()
+
+    @api.model
+    def mark_staged_lines_sent(self, notified_date):
+        self.flush()
+        self.env.cr.execute("""
+            UPDATE licence_expiration_report_ledger
+               SET state = 'sent', notified_date = %s, write_uid = %s, write_date = now() at time zone 'UTC'
+             WHERE state = 'staged'
+        """, (notified_date, self.env.uid))
+        self.invalidate_cache()
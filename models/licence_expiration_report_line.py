@@ -0,0 +1,85 @@
+from odoo import fields, models, tools
+
+
+class LicenceExpirationReportLine(models.Model):
+    _name = 'licence.expiration.report.line'
+    _description = 'Licence Expirations'
+    _auto = False
+    _order = 'expiration_date, id'
+    _rec_name = 'inv_line_id'
+
+    inv_line_id = fields.Many2one(
+        'account.move.line', string='Invoice Line', readonly=True)
+    move_id = fields.Many2one('account.move', string='Invoice', readonly=True)
+    invoice_date = fields.Date(string='Invoice Date', readonly=True)
+    product_id = fields.Many2one(
+        'product.product', string='Product', readonly=True)
+    licence_length_months = fields.Integer(
+        string='Licence Length (Months)', readonly=True, group_operator='avg')
+    expiration_date = fields.Date(string='Expiration Date', readonly=True)
+    days_remaining = fields.Integer(
+        string='Days Remaining', readonly=True, group_operator='min')
+    sale_order_id = fields.Many2one(
+        'sale.order', string='Sale Order', readonly=True)
+    partner_id = fields.Many2one(
+        'res.partner', string='Customer', readonly=True)
+    partner_shipping_id = fields.Many2one(
+        'res.partner', string='Delivery Address', readonly=True)
+    salesperson_id = fields.Many2one(
+        'res.users', string='Salesperson', readonly=True)
+    team_id = fields.Many2one('crm.team', string='Sales Team', readonly=True)
+    company_id = fields.Many2one(
+        'res.company', string='Company', readonly=True)
+    renewal_line_id = fields.Many2one(
+        'account.move.line', string='Renewed By', readonly=True)
+    omitted = fields.Boolean(
+        string='Omitted', readonly=True,
+        help='A linked sale order line is excluded from the licence expiration report')
+
+    def init(self):
+        # The salesperson and sales team come from the first linked sale order,
+        # as in the emailed report
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        self.env.cr.execute("""
+            CREATE OR REPLACE VIEW %s AS (
+                SELECT aml.id AS id,
+                       aml.id AS inv_line_id,
+                       aml.move_id AS move_id,
+                       am.invoice_date AS invoice_date,
+                       aml.product_id AS product_id,
+                       pp.x_licence_length_months AS licence_length_months,
+                       aml.licence_expiration_date AS expiration_date,
+                       aml.licence_expiration_date - CURRENT_DATE AS days_remaining,
+                       first_so.order_id AS sale_order_id,
+                       am.partner_id AS partner_id,
+                       am.partner_shipping_id AS partner_shipping_id,
+                       so_partner.user_id AS salesperson_id,
+                       so.team_id AS team_id,
+                       am.company_id AS company_id,
+                       aml.licence_renewal_line_id AS renewal_line_id,
+                       EXISTS (
+                           SELECT 1
+                             FROM sale_order_line_invoice_rel rel
+                             JOIN sale_order_line sol ON sol.id = rel.order_line_id
+                            WHERE rel.invoice_line_id = aml.id
+                              AND sol.x_omit_from_licence_expiration_report
+                       ) AS omitted
+                  FROM account_move_line aml
+                  JOIN account_move am ON am.id = aml.move_id
+                  JOIN product_product pp ON pp.id = aml.product_id
+                  LEFT JOIN LATERAL (
+                           SELECT sol.order_id
+                             FROM sale_order_line_invoice_rel rel
+                             JOIN sale_order_line sol ON sol.id = rel.order_line_id
+                            WHERE rel.invoice_line_id = aml.id
+                            ORDER BY sol.order_id, sol.sequence, sol.id
+                            LIMIT 1
+                       ) first_so ON TRUE
+                  LEFT JOIN sale_order so ON so.id = first_so.order_id
+                  LEFT JOIN res_partner so_partner ON so_partner.id = so.partner_id
+                 WHERE am.state = 'posted'
+                   AND am.move_type = 'out_invoice'
+                   AND NOT aml.exclude_from_invoice_tab
+                   AND aml.licence_expiration_date IS NOT NULL
+            )
+        """ % self._table)
@@ -0,0 +1,138 @@
+from odoo import api, fields, models
+from contextlib import contextmanager
+import time
+
+REPORT_RUN_STAGES = ['data_query', 'row_building',
+                     'activity', 'xlsx', 'mail']
+
+
+class ReportRunStats:
+    """
+    Accumulates wall time and SQL query count per report stage, across the cursors of one run.
+    Time spent in a stage nested inside another one is only counted for the inner stage.
+    """
+
+    def __init__(self):
+        self.stage_durations = dict.fromkeys(REPORT_RUN_STAGES, 0.0)
+        self.stage_query_counts = dict.fromkeys(REPORT_RUN_STAGES, 0)
+        self.row_count = 0
+        self.activity_count = 0
+        self.attachment_size = 0
+        self.errors = []
+
+    @contextmanager
+    def measure(self, stage_name, cr):
+        durations_before = dict(self.stage_durations)
+        query_counts_before = dict(self.stage_query_counts)
+        query_count = cr.sql_log_count
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            nested_duration = sum(self.stage_durations[stage] - durations_before[stage]
+                                  for stage in REPORT_RUN_STAGES if stage != stage_name)
+            nested_query_count = sum(self.stage_query_counts[stage] - query_counts_before[stage]
+                                     for stage in REPORT_RUN_STAGES if stage != stage_name)
+            self.stage_durations[stage_name] += time.perf_counter() - \
+                start_time - nested_duration
+            self.stage_query_counts[stage_name] += cr.sql_log_count - \
+                query_count - nested_query_count
+
+    def measure_rows(self, report_rows, cr):
+        """
+        Yields report rows, counting them and booking the time spent producing them to row_building.
+        """
+        while True:
+            with self.measure('row_building', cr):
+                report_row = next(report_rows, None)
+            if report_row is None:
+                return
+            self.row_count += 1
+            yield report_row
+
+
+class LicenceExpirationReportRun(models.Model):
+    _name = 'licence.expiration.report.run'
+    _description = 'Licence Expiration Report Run'
+    _order = 'start_datetime desc, id desc'
+    _rec_name = 'start_datetime'
+
+    run_date = fields.Date(string='Report Date', required=True, index=True)
+    start_datetime = fields.Datetime(string='Started', required=True)
+    end_datetime = fields.Datetime(string='Finished')
+    duration = fields.Float(string='Duration (s)', group_operator='avg')
+    state = fields.Selection([
+        ('running', 'Running'),
+        ('done', 'Sent'),
+        ('no_data', 'No Data'),
+        ('replayed', 'Replayed'),
+        ('skipped', 'Skipped'),
+        ('failed', 'Failed'),
+    ], string='Status', required=True, default='running')
+    run_type = fields.Selection([
+        ('cron', 'Daily Run'),
+        ('replay', 'Replay'),
+    ], string='Type', required=True, default='cron')
+    date_from = fields.Date(string='Window Start')
+    time_checkpoints = fields.Char(string='Time Checkpoints')
+    row_count = fields.Integer(string='Rows')
+    activity_count = fields.Integer(string='Activities Created')
+    attachment_size = fields.Integer(string='Attachment Size (Bytes)')
+    error = fields.Text(string='Errors')
+    attachment_ids = fields.One2many(
+        'ir.attachment', 'res_id', string='Report Files',
+        domain=[('res_model', '=', 'licence.expiration.report.run')])
+
+    data_query_duration = fields.Float(
+        string='Data Query (s)', group_operator='avg')
+    data_query_queries = fields.Integer(
+        string='Data Query Queries', group_operator='avg')
+    row_building_duration = fields.Float(
+        string='Row Building (s)', group_operator='avg')
+    row_building_queries = fields.Integer(
+        string='Row Building Queries', group_operator='avg')
+    activity_duration = fields.Float(
+        string='Activity Scheduling (s)', group_operator='avg')
+    activity_queries = fields.Integer(
+        string='Activity Scheduling Queries', group_operator='avg')
+    xlsx_duration = fields.Float(
+        string='XLSX Generation (s)', group_operator='avg')
+    xlsx_queries = fields.Integer(
+        string='XLSX Generation Queries', group_operator='avg')
+    mail_duration = fields.Float(string='Mail (s)', group_operator='avg')
+    mail_queries = fields.Integer(string='Mail Queries', group_operator='avg')
+
+    @api.model
+    def start_run(self, run_date, date_from=None, time_checkpoints=(), state='running'):
+        """
+        Creates the run record in its own committed transaction, so it survives a failing run.
+        Returns the run id.
+        """
+        with self.pool.cursor() as cr:
+            run = self.with_env(self.env(cr=cr)).create({
+                'run_date': run_date,
+                'date_from': date_from,
+                'start_datetime': fields.Datetime.now(),
+                'time_checkpoints': ', '.join(str(checkpoint) for checkpoint in time_checkpoints),
+                'state': state,
+            })
+            return run.id
+
+    @api.model
+    def finish_run(self, run_id, stats, state):
+        with self.pool.cursor() as cr:
+            run = self.with_env(self.env(cr=cr)).browse(run_id)
+            end_datetime = fields.Datetime.now()
+            run_vals = {
+                'end_datetime': end_datetime,
+                'duration': (end_datetime - run.start_datetime).total_seconds(),
+                'state': 'failed' if stats.errors else state,
+                'row_count': stats.row_count,
+                'activity_count': stats.activity_count,
+                'attachment_size': stats.attachment_size,
+                'error': '\n'.join(stats.errors) or False,
+            }
+            for stage in REPORT_RUN_STAGES:
+                run_vals[f'{stage}_duration'] = stats.stage_durations[stage]
+                run_vals[f'{stage}_queries'] = stats.stage_query_counts[stage]
+            run.write(run_vals)
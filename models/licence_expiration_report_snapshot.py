@@ -0,0 +1,200 @@
+from odoo import api, fields, models
+from odoo.tools import split_every
+from psycopg2.extras import execute_values
+from .license_expiration_report import ReportRow
+from datetime import date
+import hashlib
+import json
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class LicenceExpirationReportSnapshot(models.Model):
+    _name = 'licence.expiration.report.snapshot'
+    _description = 'Licence Expiration Report Snapshot'
+    _order = 'snapshot_date desc, id desc'
+    _rec_name = 'snapshot_date'
+
+    snapshot_date = fields.Date(
+        string='Report Date', required=True, index=True)
+    time_checkpoints = fields.Text(
+        string='Time Checkpoints', required=True,
+        help='Sorted, comma separated checkpoints the rows were computed for')
+    checkpoints_key = fields.Char(
+        string='Checkpoints Key', required=True,
+        help='MD5 digest of the time checkpoints, which keeps the unique index small')
+    line_ids = fields.One2many(
+        'licence.expiration.report.snapshot.line', 'snapshot_id', string='Rows')
+
+    _sql_constraints = [
+        ('date_checkpoints_uniq', 'unique(snapshot_date, checkpoints_key)',
+         'There is already a snapshot for this date and these checkpoints.'),
+    ]
+
+    def format_time_checkpoints(self, time_checkpoints):
+        return ','.join(str(checkpoint) for checkpoint in sorted(set(time_checkpoints)))
+
+    def get_checkpoints_key(self, time_checkpoints):
+        return hashlib.md5(self.format_time_checkpoints(time_checkpoints).encode()).hexdigest()
+
+    @api.model
+    def get_snapshot_rows(self, snapshot_date, time_checkpoints, company_ids=None):
+        """
+        Returns the ReportRow iterator of the report as of snapshot_date, restricted to the lines
+        of company_ids when given. The first request of the day computes the rows of every company
+        and stores them while they are streamed, later ones read them back.
+        """
+        # The snapshot is shared by all users, so it is computed without record rules
+        report = self.env['account.move'].sudo()
+        checkpoints_key = self.get_checkpoints_key(time_checkpoints)
+        self.flush()
+        self.env.cr.execute("""
+            SELECT id FROM licence_expiration_report_snapshot
+             WHERE snapshot_date = %s AND checkpoints_key = %s
+        """, (snapshot_date, checkpoints_key))
+        snapshot_row = self.env.cr.fetchone()
+        if snapshot_row:
+            return self.read_snapshot_rows(snapshot_row[0], company_ids)
+
+        # Snapshots of past days are never served again
+        self.env.cr.execute("""
+            DELETE FROM licence_expiration_report_snapshot WHERE snapshot_date < %s
+        """, (date.today(),))
+        self.env.cr.execute("""
+            INSERT INTO licence_expiration_report_snapshot
+                   (snapshot_date, time_checkpoints, checkpoints_key, create_uid, create_date, write_uid, write_date)
+            VALUES (%s, %s, %s, %s, now() at time zone 'UTC', %s, now() at time zone 'UTC')
+            ON CONFLICT (snapshot_date, checkpoints_key) DO NOTHING
+            RETURNING id
+        """, (snapshot_date, self.format_time_checkpoints(time_checkpoints), checkpoints_key,
+              self.env.uid, self.env.uid))
+        snapshot_row = self.env.cr.fetchone()
+        report_rows = report.build_report_rows(report.query_expiring_lines(
+            snapshot_date, snapshot_date, time_checkpoints))
+        if snapshot_row:
+            report_rows = self.store_snapshot_rows(
+                snapshot_row[0], report_rows)
+        if company_ids is None:
+            return report_rows
+        return self.filter_company_rows(report_rows, company_ids)
+
+    @api.model
+    def filter_company_rows(self, report_rows, company_ids):
+        """
+        Passes on the report rows of invoice lines of the given companies, checked chunk by chunk.
+        """
+        for chunk in split_every(self.env['account.move'].REPORT_CHUNK_SIZE, report_rows):
+            self.env.cr.execute("""
+                SELECT id FROM account_move_line WHERE id = ANY(%s) AND company_id = ANY(%s)
+            """, ([report_row.inv_line_id for report_row in chunk], list(company_ids)))
+            company_line_ids = {row[0] for row in self.env.cr.fetchall()}
+            yield from (report_row for report_row in chunk if report_row.inv_line_id in company_line_ids)
+
+    @api.model
+    def store_snapshot_rows(self, snapshot_id, report_rows):
+        """
+        Passes report rows through unchanged while inserting them into the snapshot chunk by chunk.
+        """
+        for chunk in split_every(self.env['account.move'].REPORT_CHUNK_SIZE, report_rows):
+            self.insert_snapshot_rows(snapshot_id, chunk)
+            yield from chunk
+
+    @api.model
+    def insert_snapshot_rows(self, snapshot_id, report_rows):
+        if not report_rows:
+            return
+        execute_values(self.env.cr, """
+            INSERT INTO licence_expiration_report_snapshot_line
+                   (snapshot_id, inv_line_id, product_id, days_until_expiry, row_values, sale_order_id,
+                    expiration_date, checkpoints, salesperson_id, team_id)
+            VALUES %s
+        """, [
+            (snapshot_id, report_row.inv_line_id, report_row.product_id, report_row.days_until_expiry,
+             json.dumps(report_row.values), report_row.sale_order_id, report_row.expiration_date,
+             ','.join(str(checkpoint) for checkpoint in report_row.checkpoints),
+             report_row.salesperson_id, report_row.team_id)
+            for report_row in report_rows
+        ], page_size=1000)
+
+    @api.model
+    def read_snapshot_rows(self, snapshot_id, company_ids=None):
+        """
+        Yields the stored rows of a snapshot in report order, only those of company_ids when given.
+        The rows are fetched at once, as the cursor may run other queries while they are consumed.
+        """
+        self.env.cr.execute("""
+            SELECT line.days_until_expiry, line.product_id, line.row_values, line.inv_line_id,
+                   line.sale_order_id, line.expiration_date, line.checkpoints,
+                   line.salesperson_id, line.team_id
+              FROM licence_expiration_report_snapshot_line line
+              JOIN account_move_line aml ON aml.id = line.inv_line_id
+              JOIN account_move am ON am.id = aml.move_id
+              JOIN product_product pp ON pp.id = line.product_id
+              JOIN product_template pt ON pt.id = pp.product_tmpl_id
+             WHERE line.snapshot_id = %s
+               AND (%s::int[] IS NULL OR am.company_id = ANY(%s::int[]))
+             ORDER BY pp.default_code, pt.name, pp.id, line.days_until_expiry,
+                      am.date DESC, am.name DESC, am.id DESC, aml.id
+        """, (snapshot_id, company_ids and list(company_ids), company_ids and list(company_ids)))
+        for (days_until_expiry, product_id, row_values, inv_line_id, sale_order_id,
+             expiration_date, checkpoints, salesperson_id, team_id) in self.env.cr.fetchall():
+            yield ReportRow(
+                days_until_expiry, product_id, tuple(json.loads(row_values)), inv_line_id,
+                sale_order_id, expiration_date,
+                tuple(int(checkpoint) for checkpoint in checkpoints.split(',')),
+                salesperson_id, team_id)
+
+    @api.model
+    def refresh_snapshot_lines(self, inv_line_ids):
+        """
+        Recomputes the rows of the given invoice lines in the snapshots of today and later,
+        after an invoice, sale order line or product change that may affect them.
+        """
+        if not inv_line_ids:
+            return
+        self.flush()
+        self.env.cr.execute("""
+            SELECT id, snapshot_date, time_checkpoints FROM licence_expiration_report_snapshot
+             WHERE snapshot_date >= %s
+        """, (date.today(),))
+        snapshots = self.env.cr.fetchall()
+        if not snapshots:
+            return
+
+        report = self.env['account.move']
+        inv_line_ids = list(inv_line_ids)
+        for snapshot_id, snapshot_date, snapshot_checkpoints in snapshots:
+            self.env.cr.execute("""
+                DELETE FROM licence_expiration_report_snapshot_line
+                 WHERE snapshot_id = %s AND inv_line_id = ANY(%s)
+            """, (snapshot_id, inv_line_ids))
+            time_checkpoints = [int(checkpoint)
+                                for checkpoint in snapshot_checkpoints.split(',')]
+            self.insert_snapshot_rows(snapshot_id, list(report.build_report_rows(report.query_expiring_lines(
+                snapshot_date, snapshot_date, time_checkpoints, line_ids=inv_line_ids))))
+        self.invalidate_cache()
+
+
+class LicenceExpirationReportSnapshotLine(models.Model):
+    _name = 'licence.expiration.report.snapshot.line'
+    _description = 'Licence Expiration Report Snapshot Row'
+    _log_access = False
+
+    snapshot_id = fields.Many2one(
+        'licence.expiration.report.snapshot', string='Snapshot', required=True, index=True, ondelete='cascade')
+    inv_line_id = fields.Many2one(
+        'account.move.line', string='Invoice Line', required=True, index=True, ondelete='cascade')
+    product_id = fields.Many2one(
+        'product.product', string='Product', ondelete='cascade')
+    days_until_expiry = fields.Integer(string='Days Until Expiry')
+    row_values = fields.Text(
+        string='Row Values', help='JSON list of the report cell values')
+    sale_order_id = fields.Many2one(
+        'sale.order', string='Sale Order', ondelete='set null')
+    expiration_date = fields.Date(string='Expiration Date')
+    checkpoints = fields.Char(string='Checkpoints')
+    salesperson_id = fields.Many2one(
+        'res.users', string='Salesperson', ondelete='set null')
+    team_id = fields.Many2one(
+        'crm.team', string='Sales Team', ondelete='set null')
@@ -1,15 +1,24 @@
 from odoo.exceptions import UserError
-from odoo import models, fields
-from datetime import date, timedelta, datetime
-import dateutil.relativedelta
+from odoo import api, models, fields, tools
+from odoo.tools import split_every
+from .licence_expiration_report_run import ReportRunStats
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+import itertools
 import xlsxwriter
 import io
-import base64
+import tempfile
 import logging
 import re
 
 _logger = logging.getLogger(__name__)
 
+# One report line: days until expiry, product.product id, the HEADER_VALUES_LIST cell values,
+# the ids needed to schedule its activity, the checkpoints it was found at and its fan-out groups
+ReportRow = namedtuple('ReportRow', [
+    'days_until_expiry', 'product_id', 'values', 'inv_line_id', 'sale_order_id', 'expiration_date',
+    'checkpoints', 'salesperson_id', 'team_id'])
+
 
 class LicenseExpirationReport(models.Model):
     _inherit = 'account.move'
@@ -20,43 +29,125 @@ class LicenseExpirationReport(models.Model):
         'Invoice Date', 'Licence Length (Months)', 'Expiration date',
         'Sale Order', 'Delivery Address', 'Salesperson', 'Product Variant ID'
     ]
+    REPORT_CHUNK_SIZE = 1000
+    MAX_CATCH_UP_DAYS = 31
+    MAX_EXPORT_HORIZON_DAYS = 3660
+    MAX_REPLAY_DAYS = 366
+    PRODUCT_CHUNK_SIZE = 500
+    # Key of the Postgres advisory lock held while the report runs
+    RUN_LOCK_KEY = 74320915
+
+    def _post(self, soft=True):
+        posted = super()._post(soft)
+        invoice_lines = posted.filtered(
+            lambda move: move.move_type == 'out_invoice').invoice_line_ids
+        renewed_line_ids = []
+        if invoice_lines:
+            # The posted lines can renew earlier licences, and be renewed themselves by later invoices
+            # when they are back-dated
+            renewed_line_ids = invoice_lines._update_licence_renewal_index(renewal_line_ids=invoice_lines.ids) + \
+                invoice_lines._update_licence_renewal_index(
+                    renewed_line_ids=invoice_lines.ids)
+        self.refresh_licence_snapshot_lines(renewed_line_ids)
+        return posted
+
+    def button_cancel(self):
+        result = super().button_cancel()
+        self.refresh_licence_snapshot_lines(self.clear_licence_renewal_index())
+        return result
+
+    def button_draft(self):
+        result = super().button_draft()
+        self.refresh_licence_snapshot_lines(self.clear_licence_renewal_index())
+        return result
+
+    def clear_licence_renewal_index(self):
+        invoices = self.filtered(
+            lambda move: move.move_type == 'out_invoice')
+        return invoices.invoice_line_ids._clear_licence_renewal_index()
+
+    def refresh_licence_snapshot_lines(self, renewed_line_ids=()):
+        invoices = self.filtered(
+            lambda move: move.move_type == 'out_invoice')
+        if invoices or renewed_line_ids:
+            self.env['licence.expiration.report.snapshot'].refresh_snapshot_lines(
+                invoices.invoice_line_ids.ids + list(renewed_line_ids))
+
+    def collect_activity_candidates(self, report_rows, activity_candidates):
+        """
+        Passes report rows through unchanged while collecting
+        (sale_order_id, inv_line_id, product_id, date_deadline) tuples for create_scheduled_activities.
+        """
+        for report_row in report_rows:
+            if report_row.sale_order_id:
+                activity_candidates.append((
+                    report_row.sale_order_id, report_row.inv_line_id,
+                    report_row.product_id, report_row.expiration_date))
+            else:
+                _logger.error(
+                    f"No SO associated with inv_line #{report_row.inv_line_id}")
+            yield report_row
+
+    def collect_notified_lines(self, report_rows, notified_lines):
+        """
+        Passes report rows through unchanged while collecting
+        (inv_line_id, checkpoint, expiration_date) tuples for the ledger.
+        """
+        for report_row in report_rows:
+            notified_lines.extend(
+                (report_row.inv_line_id, checkpoint, report_row.expiration_date)
+                for checkpoint in report_row.checkpoints)
+            yield report_row
 
-    def create_scheduled_activity(self, inv_line, info_str, days_until_expiration):
-        activity_summary = f'Licence Expiration (#{inv_line.id})'
-        sale_order_model_id = 280
-        date_deadline = datetime.now() + timedelta(days=days_until_expiration)
-        date_deadline_formated = date_deadline.strftime('%d/%m/%Y')
-        if not inv_line.sale_line_ids:
-            _logger.error(f"No sale_line_ids on inv_line #{inv_line.id}")
-            return None
-        if not inv_line.sale_line_ids[0].order_id:
-            _logger.error(f"No SO associated with inv_line #{inv_line.id}")
-            return None
+    def create_scheduled_activities(self, activity_candidates):
+        """
+        Schedules one activity per reported invoice line on its sale order, skipping lines that
+        already have one. Runs a constant number of queries whatever the number of candidates.
+        """
+        if not activity_candidates:
+            return self.env['mail.activity']
 
-        sale_order = inv_line.sale_line_ids[0].order_id
+        sale_order_model_id = self.env['ir.model']._get_id('sale.order')
+        sale_orders = self.env['sale.order'].browse(
+            {candidate[0] for candidate in activity_candidates})
+        products = self.env['product.product'].browse(
+            {candidate[2] for candidate in activity_candidates})
 
-        existing_activity = self.env['mail.activity'].search([
+        existing_activities = self.env['mail.activity'].search_read([
             ('res_model_id', '=', sale_order_model_id),
-            ('res_id', '=', sale_order.id),
-            ('date_deadline', '=', date_deadline),
-            ('summary', '=', activity_summary)])
-
-        if existing_activity:
-            return None
-
-        self.env['mail.activity'].create({
-            'date_deadline': date_deadline,
-            'res_id': sale_order.id,
-            # 'sale.order' ir.model #280
-            'res_model_id': 280,
-            'user_id': sale_order.user_id.id,
-            'note': f'<div style="margin-top: 5px;">Licence expires on  <strong>{date_deadline_formated}</strong>.</div><div style="margin-top: 5px;">Product: {inv_line.product_id.display_name}.</div>',
-            'display_name': f'{inv_line.id}',
-            'summary': activity_summary,
-        })
+            ('res_id', 'in', sale_orders.ids),
+            ('summary', '=like', 'Licence Expiration (#%)')],
+            ['res_id', 'date_deadline', 'summary'])
+        existing_keys = {
+            (activity['res_id'], activity['date_deadline'], activity['summary'])
+            for activity in existing_activities}
+
+        # Loading the names in batch instead of one record at a time
+        sale_order_users = {
+            sale_order.id: sale_order.user_id.id for sale_order in sale_orders}
+        product_names = {
+            product.id: product.display_name for product in products}
+
+        activity_vals_list = []
+        for sale_order_id, inv_line_id, product_id, date_deadline in activity_candidates:
+            activity_summary = f'Licence Expiration (#{inv_line_id})'
+            activity_key = (sale_order_id, date_deadline, activity_summary)
+            if activity_key in existing_keys:
+                continue
+            existing_keys.add(activity_key)
+
+            date_deadline_formated = date_deadline.strftime('%d/%m/%Y')
+            activity_vals_list.append({
+                'date_deadline': date_deadline,
+                'res_id': sale_order_id,
+                'res_model_id': sale_order_model_id,
+                'user_id': sale_order_users[sale_order_id],
+                'note': f'<div style="margin-top: 5px;">Licence expires on  <strong>{date_deadline_formated}</strong>.</div><div style="margin-top: 5px;">Product: {product_names[product_id]}.</div>',
+                'display_name': f'{inv_line_id}',
+                'summary': activity_summary,
+            })
 
-    def is_integer(self, string):
-        return bool(re.match(r"-?\d+$", string))
+        return self.env['mail.activity'].create(activity_vals_list)
 
     def get_config_param(self, key):
         try:
@@ -65,21 +156,18 @@ class LicenseExpirationReport(models.Model):
             _logger.error(f"Error getting configuration parameter {key}: {e}")
             return ''
 
-    def get_time_checkpoints(self):
-        try:
-            time_string = self.env['ir.config_parameter'].get_param(
-                'licence_expiration_report.time_checkpoints')
-            if not time_string:
-                return []
-            time_string_list = time_string.replace(', ', ',').split(',')
+    @tools.ormcache()
+    def get_report_settings(self):
+        """
+        Returns the ReportSettings snapshot, cached across requests until the settings are saved.
+        """
+        return self.env['res.config.settings'].load_report_settings()
 
-            return [int(time_str) for time_str in time_string_list if self.is_integer(time_str)]
-        except Exception as e:
-            _logger.error(f"Error in retrieving time checkpoints: {e}")
-            return []
+    def get_time_checkpoints(self):
+        return list(self.get_report_settings().time_checkpoints)
 
     def log_message(self, message, function_name):
-        self.env['ir.logging'].create({
+        self.env['ir.logging'].sudo().create({
             'name': 'Licence Expiration Report',
             'type': 'server',
             'dbname': self.env.cr.dbname,
@@ -90,24 +178,19 @@ class LicenseExpirationReport(models.Model):
             'func': f'__{function_name}__',
         })
 
-    def get_sale_order_name(self, inv_line):
+    def get_sale_order_name(self, line_values):
         """
         Extracts and concatenates sale order names from invoice lines.
         """
         so_name_list = [
-            so_line.order_id.name for so_line in inv_line.sale_line_ids]
+            so_line['order_name'] for so_line in line_values['sale_lines']]
         return ', '.join(so_name_list) if so_name_list else ''
 
-    def get_sale_order_obj(self, inv_line):
+    def get_sale_order_obj(self, line_values):
         """
-        Extracts the first sale order object from the invoice line.
+        Extracts the first sale order of the invoice line, as a dict of its loaded values.
         """
-        try:
-            # Attempt to return the first sale order object if it exists
-            return inv_line.sale_line_ids and inv_line.sale_line_ids[0].order_id or None
-        except Exception as e:
-            _logger.error('Failed to extract sale order object: %s', e)
-            return None
+        return line_values['sale_lines'][0] if line_values['sale_lines'] else None
 
     def process_field(self, field_value):
         """
@@ -126,139 +209,347 @@ class LicenseExpirationReport(models.Model):
         else:
             return 'Expires today'
 
-    def get_salesperson_from_so_partner(self, inv_line):
-        sale_order = self.get_sale_order_obj(inv_line)
+    def get_salesperson_from_so_partner(self, line_values):
+        sale_order = self.get_sale_order_obj(line_values)
         if not sale_order:
             return None
-        if sale_order.partner_id.user_id:
-            return sale_order.partner_id.user_id.name
-        else:
-            return None
+        return sale_order['salesperson_name'] or None
 
-    def process_invoice_line(self, inv_line, invoice, product, days_until_expiry):
-        if invoice.invoice_date and product.x_licence_length_months:
-            expiration_date = invoice.invoice_date + \
-                dateutil.relativedelta.relativedelta(
-                    months=product.x_licence_length_months)
-        else:
-            expiration_date = None
+    def load_report_line_values(self, line_ids):
+        """
+        Loads everything a report row needs for the given invoice lines with a fixed number of
+        batched reads, whatever the number of lines.
+        Returns {inv_line_id: line_values}, where line_values is a plain dict and
+        line_values['sale_lines'] holds one dict per linked sale order line.
+        """
+        def many2one_id(value):
+            return value[0] if value else False
+
+        def many2one_name(value):
+            return value[1] if value else False
+
+        inv_lines = self.env['account.move.line'].browse(line_ids).read(
+            ['move_id', 'product_id', 'sale_line_ids', 'licence_expiration_date'], load='_classic_write')
+        invoices = {invoice['id']: invoice for invoice in self.env['account.move'].browse(
+            {inv_line['move_id'] for inv_line in inv_lines}).read(['name', 'invoice_date', 'partner_shipping_id'])}
+        products = {product['id']: product for product in self.env['product.product'].browse(
+            {inv_line['product_id'] for inv_line in inv_lines}).read(['default_code', 'name', 'x_licence_length_months'])}
+        so_lines = {so_line['id']: so_line for so_line in self.env['sale.order.line'].browse(
+            {so_line_id for inv_line in inv_lines for so_line_id in inv_line['sale_line_ids']}).read(
+            ['order_id', 'x_omit_from_licence_expiration_report'], load='_classic_write')}
+        sale_orders = {sale_order['id']: sale_order for sale_order in self.env['sale.order'].browse(
+            {so_line['order_id'] for so_line in so_lines.values()}).read(['name', 'partner_id', 'team_id'], load='_classic_write')}
+        partners = {partner['id']: partner for partner in self.env['res.partner'].browse(
+            {sale_order['partner_id'] for sale_order in sale_orders.values()}).read(['user_id'])}
+
+        report_line_values = {}
+        for inv_line in inv_lines:
+            invoice = invoices[inv_line['move_id']]
+            product = products.get(inv_line['product_id'], {})
+            sale_lines = []
+            for so_line_id in inv_line['sale_line_ids']:
+                so_line = so_lines[so_line_id]
+                sale_order = sale_orders[so_line['order_id']]
+                salesperson = partners[sale_order['partner_id']]['user_id']
+                sale_lines.append({
+                    'order_id': sale_order['id'],
+                    'order_name': sale_order['name'],
+                    'team_id': sale_order['team_id'],
+                    'salesperson_id': many2one_id(salesperson),
+                    'salesperson_name': many2one_name(salesperson),
+                    'omit': so_line['x_omit_from_licence_expiration_report'],
+                })
+            report_line_values[inv_line['id']] = {
+                'id': inv_line['id'],
+                'product_id': inv_line['product_id'],
+                'product_code': product.get('default_code'),
+                'product_name': product.get('name'),
+                'licence_length_months': product.get('x_licence_length_months'),
+                'expiration_date': inv_line['licence_expiration_date'],
+                'invoice_name': invoice['name'],
+                'invoice_date': invoice['invoice_date'],
+                'delivery_address': many2one_name(invoice['partner_shipping_id']),
+                'sale_lines': sale_lines,
+            }
+        return report_line_values
+
+    def process_invoice_line(self, line_values, days_until_expiry):
+        expiration_date = line_values['expiration_date']
 
         return [
             self.get_note_text(days_until_expiry),
-            self.process_field(inv_line.product_id.default_code),
-            self.process_field(inv_line.product_id.name),
-            self.process_field(invoice.name),
-            self.process_field(invoice.invoice_date.strftime(
-                '%Y-%m-%d')) if invoice.invoice_date else '/',
-            self.process_field(product.x_licence_length_months),
+            self.process_field(line_values['product_code']),
+            self.process_field(line_values['product_name']),
+            self.process_field(line_values['invoice_name']),
+            self.process_field(line_values['invoice_date'].strftime(
+                '%Y-%m-%d')) if line_values['invoice_date'] else '/',
+            self.process_field(line_values['licence_length_months']),
             self.process_field(expiration_date.strftime(
                 '%Y-%m-%d')) if expiration_date else '/',
-            self.process_field(self.get_sale_order_name(inv_line)),
-            self.process_field(invoice.partner_shipping_id.display_name),
-            self.process_field(self.get_salesperson_from_so_partner(inv_line)),
-            self.process_field(inv_line.product_id.id),
+            self.process_field(self.get_sale_order_name(line_values)),
+            self.process_field(line_values['delivery_address']),
+            self.process_field(
+                self.get_salesperson_from_so_partner(line_values)),
+            self.process_field(line_values['product_id']),
         ]
 
-    def check_if_any_data_found(self, data_dict):
-        """
-        Checks if passed in dictionary contains data in nested lists. If no data found, returns False.
-
-        Args:
-            data_dict (dictionary)
-            Example:
-            {product.product(12846,): {30: [], 60: [], 90: []}, product.product(15643,): {30: [], 60: [], 90: []}, product.product(14851,): {30: [], 60: [], 90: []}}
-        Returns: True/False
-        """
-        for inner_dict in data_dict.values():
-            for value_list in inner_dict.values():
-                if value_list:  # Checks if the list is non-empty
-                    return True
-        return False
-
-    def switch_on_so_line_is_on(self, inv_line):
+    def switch_on_so_line_is_on(self, line_values):
         # Check if the invoice line has associated sale line ids
-        if not inv_line.sale_line_ids:
+        if not line_values['sale_lines']:
             _logger.warning('WARNING: No inv_line.sale_line_ids')
             return False
 
         # Return True if any of the sale lines are marked to omit from license expiration report
         # This checks each sale line's custom field 'x_omit_from_licence_expiration_report'
-        return any(so_line.x_omit_from_licence_expiration_report for so_line in inv_line.sale_line_ids)
+        return any(so_line['omit'] for so_line in line_values['sale_lines'])
 
-    def get_and_format_data(self):
+    def query_expiring_lines(self, date_from, date_to, time_checkpoints, skip_notified=False, product_ids=None, line_ids=None,
+                             company_ids=None):
         """
-        Generates a dictionary with report data structured as:
-        {product: {days_until_expiry: [[invoice_line_data], ...]}, ...}
+        Returns (inv_line_id, days_until_expiry, checkpoints) tuples for every posted customer invoice line
+        whose licence reached one of the time checkpoints on a day between date_from and date_to, in report order:
+        product (default_code, name, id), checkpoint, invoice (date desc, name desc, id desc), line id.
+
+        days_until_expiry is counted from date_to, checkpoints lists every checkpoint the line reached.
+        The expiry is counted forward from the invoice date (invoice_date + licence length), so an invoice
+        dated the 29th to 31st expires on the last day of a shorter month and is reported exactly once
+        per checkpoint, where counting back from the report date skipped it or reported it twice.
+        Licences already renewed by a later invoice line are left out.
+        With skip_notified, (line, checkpoint) pairs already in the ledger are left out.
+        With product_ids, only lines of these products are returned, with line_ids only these lines
+        and with company_ids only lines of invoices of these companies.
         """
-        try:
-            today_date = date.today()
-            report_data_dict = {}
-
-            # Searching for products with a defined license length
-            all_products = self.env['product.product'].search([
-                ('x_licence_length_months', '>', 0),
-                ('active', 'in', [True, False])
-            ])
-
-            if not all_products:
-                _logger.warning('WARNING: No products found')
-                return {}
-
-            # Looping through each product to populate report data
-            for product in all_products:
-                time_checkpoints = self.get_time_checkpoints()
-
-                report_data_dict[product] = {days: []
-                                             for days in time_checkpoints}
-                for days_until_expiry in time_checkpoints:
-                    time_boundary = today_date + timedelta(days=days_until_expiry) - \
-                        dateutil.relativedelta.relativedelta(
-                            months=product.x_licence_length_months)
-
-                    invoices = self.env['account.move'].search([
-                        ('invoice_line_ids.product_id', '=', product.id),
-                        ('invoice_date', '=', time_boundary),
-                        ('state', 'in', ['posted']),
-                        ('move_type', '=', 'out_invoice'),
-                    ])
-
-                    if not invoices:
-                        report_data_dict[product][days_until_expiry] = []
-                        continue
+        if not time_checkpoints:
+            return []
+        self.env['account.move.line'].flush()
+        self.env['account.move'].flush()
+        self.env['product.product'].flush()
+        self.env['licence.expiration.report.ledger'].flush()
+        # Joining on the indexed licence_expiration_date turns every checkpoint into an index range scan
+        self.env.cr.execute("""
+            SELECT aml.id, aml.licence_expiration_date - %(date_to)s::date,
+                   array_agg(cp.days ORDER BY cp.position)
+              FROM unnest(%(checkpoints)s::int[]) WITH ORDINALITY AS cp(days, position)
+              JOIN account_move_line aml
+                ON aml.licence_expiration_date BETWEEN %(date_from)s::date + cp.days
+                                                   AND %(date_to)s::date + cp.days
+              JOIN account_move am ON am.id = aml.move_id
+              JOIN product_product pp ON pp.id = aml.product_id
+              JOIN product_template pt ON pt.id = pp.product_tmpl_id
+             WHERE am.state = 'posted'
+               AND am.move_type = 'out_invoice'
+               AND NOT aml.exclude_from_invoice_tab
+               AND aml.licence_renewal_line_id IS NULL
+               AND (%(product_ids)s::int[] IS NULL OR aml.product_id = ANY(%(product_ids)s::int[]))
+               AND (%(line_ids)s::int[] IS NULL OR aml.id = ANY(%(line_ids)s::int[]))
+               AND (%(company_ids)s::int[] IS NULL OR am.company_id = ANY(%(company_ids)s::int[]))
+               AND (NOT %(skip_notified)s OR NOT EXISTS (
+                       SELECT 1
+                         FROM licence_expiration_report_ledger ledger
+                        WHERE ledger.inv_line_id = aml.id
+                          AND ledger.checkpoint = cp.days))
+             GROUP BY aml.id, pp.default_code, pt.name, pp.id, am.date, am.name, am.id
+             ORDER BY pp.default_code, pt.name, pp.id, min(cp.position),
+                      am.date DESC, am.name DESC, am.id DESC, aml.id
+        """, {
+            'checkpoints': list(time_checkpoints),
+            'date_from': date_from,
+            'date_to': date_to,
+            'skip_notified': skip_notified,
+            'product_ids': list(product_ids) if product_ids is not None else None,
+            'line_ids': list(line_ids) if line_ids is not None else None,
+            'company_ids': list(company_ids) if company_ids is not None else None,
+        })
+        return self.env.cr.fetchall()
 
-                    inv_lines_data_list = []
-                    for invoice in invoices:
-                        inv_lines = [
-                            line for line in invoice.invoice_line_ids if line.product_id.id == product.id]
+    def query_replay_lines(self, date_from, date_to, time_checkpoints):
+        """
+        Returns (as_of_date, inv_line_id, checkpoint) tuples of every line each daily report between
+        date_from and date_to would have contained, ordered by as_of_date and then in report order.
+        """
+        if not time_checkpoints:
+            return []
+        self.env['account.move.line'].flush()
+        self.env['account.move'].flush()
+        self.env['product.product'].flush()
+        self.env.cr.execute("""
+            SELECT aml.licence_expiration_date - cp.days, aml.id, cp.days
+              FROM unnest(%(checkpoints)s::int[]) WITH ORDINALITY AS cp(days, position)
+              JOIN account_move_line aml
+                ON aml.licence_expiration_date BETWEEN %(date_from)s::date + cp.days
+                                                   AND %(date_to)s::date + cp.days
+              JOIN account_move am ON am.id = aml.move_id
+              JOIN product_product pp ON pp.id = aml.product_id
+              JOIN product_template pt ON pt.id = pp.product_tmpl_id
+             WHERE am.state = 'posted'
+               AND am.move_type = 'out_invoice'
+               AND NOT aml.exclude_from_invoice_tab
+             ORDER BY aml.licence_expiration_date - cp.days, pp.default_code, pt.name, pp.id, cp.position,
+                      am.date DESC, am.name DESC, am.id DESC, aml.id
+        """, {
+            'checkpoints': list(time_checkpoints),
+            'date_from': date_from,
+            'date_to': date_to,
+        })
+        return self.env.cr.fetchall()
 
-                        if not inv_lines:
-                            _logger.warning('WARNING: No INV lines found')
-                            continue
+    def replay_licence_expiration_report(self, date_from, date_to, create_activities=False, send_email=False, dry_run=True):
+        """
+        Computes the daily reports for every day from date_from to date_to in one set-based pass,
+        e.g. to replay the days missed during an outage or to audit what a past report contained.
+        Each day gets its own XLSX attachment. Unless dry_run is set, the activities of the reported
+        lines can be scheduled and each daily report emailed. The ledger is left untouched.
+        The replay is recorded in licence.expiration.report.run, which keeps the attachments.
+        Returns the ir.attachment records of the daily reports.
+        """
+        if date_to < date_from:
+            raise UserError('The end date must be after the start date.')
+        if (date_to - date_from).days > self.MAX_REPLAY_DAYS:
+            raise UserError(
+                f'A replay cannot cover more than {self.MAX_REPLAY_DAYS} days.')
+
+        settings = self.get_report_settings()
+        # The run log is only readable by sales managers, the replay itself is what they may trigger
+        replay_run = self.env['licence.expiration.report.run'].sudo().create({
+            'run_type': 'replay',
+            'run_date': date_to,
+            'date_from': date_from,
+            'start_datetime': fields.Datetime.now(),
+            'time_checkpoints': ', '.join(str(checkpoint) for checkpoint in settings.time_checkpoints),
+        })
+        attachments = self.env['ir.attachment']
+        activity_candidates = []
+        activity_count = 0
+        replay_lines = self.query_replay_lines(
+            date_from, date_to, settings.time_checkpoints)
+
+        for as_of_date, day_lines in itertools.groupby(replay_lines, key=lambda replay_line: replay_line[0]):
+            report_rows = self.build_report_rows(
+                [(line_id, checkpoint, [checkpoint]) for _as_of_date, line_id, checkpoint in day_lines])
+            if not dry_run and create_activities:
+                report_rows = self.collect_activity_candidates(
+                    report_rows, activity_candidates)
+
+            first_row = next(report_rows, None)
+            if first_row is None:
+                continue
+            binary_data = self.generate_xlsx_file(
+                itertools.chain([first_row], report_rows), settings, report_date=as_of_date)
+            if not binary_data:
+                raise UserError(
+                    f"The report of {as_of_date.strftime('%d/%m/%y')} could not be generated.")
+            subject = f"{self.HEADER_TEXT} ({as_of_date.strftime('%d/%m/%y')})"
+            day_attachment = self.create_email_attachment(
+                binary_data, subject, replay_run)
+            attachments |= day_attachment
+
+            if not dry_run and send_email and not self.send_report_email(subject, day_attachment, settings):
+                raise UserError(
+                    f"The report of {as_of_date.strftime('%d/%m/%y')} could not be emailed.")
+
+        if activity_candidates:
+            activity_count = len(
+                self.create_scheduled_activities(activity_candidates))
+
+        end_datetime = fields.Datetime.now()
+        replay_run.write({
+            'end_datetime': end_datetime,
+            'duration': (end_datetime - replay_run.start_datetime).total_seconds(),
+            'state': 'replayed' if attachments else 'no_data',
+            'activity_count': activity_count,
+            'attachment_size': sum(attachments.mapped('file_size')),
+        })
+        return attachments
+
+    def get_catch_up_date_from(self, today_date):
+        """
+        Returns the first day the incremental run has to cover: the day after the last successful run,
+        going back at most MAX_CATCH_UP_DAYS.
+        """
+        last_success_date = fields.Date.to_date(self.get_config_param(
+            'licence_expiration_report.last_success_date') or None)
+        if not last_success_date or last_success_date >= today_date:
+            return today_date
+        return max(last_success_date + timedelta(days=1),
+                   today_date - timedelta(days=self.MAX_CATCH_UP_DAYS))
+
+    def set_last_success_date(self, run_date):
+        self.env['ir.config_parameter'].sudo().set_param(
+            'licence_expiration_report.last_success_date', fields.Date.to_string(run_date))
+
+    def query_staged_lines(self, date_to):
+        """
+        Returns (inv_line_id, days_until_expiry, checkpoints) tuples for the lines staged in the ledger
+        by the chunk runs, in the same report order as query_expiring_lines.
+        """
+        self.env['licence.expiration.report.ledger'].flush()
+        self.env.cr.execute("""
+            SELECT aml.id, aml.licence_expiration_date - %(date_to)s::date,
+                   array_agg(ledger.checkpoint ORDER BY ledger.checkpoint)
+              FROM licence_expiration_report_ledger ledger
+              JOIN account_move_line aml ON aml.id = ledger.inv_line_id
+              JOIN account_move am ON am.id = aml.move_id
+              JOIN product_product pp ON pp.id = aml.product_id
+              JOIN product_template pt ON pt.id = pp.product_tmpl_id
+             WHERE ledger.state = 'staged'
+             GROUP BY aml.id, pp.default_code, pt.name, pp.id, am.date, am.name, am.id
+             ORDER BY pp.default_code, pt.name, pp.id, min(ledger.checkpoint),
+                      am.date DESC, am.name DESC, am.id DESC, aml.id
+        """, {'date_to': date_to})
+        return self.env.cr.fetchall()
+
+    def get_and_format_data(self, settings=None, date_from=None, date_to=None, skip_notified=False, product_ids=None):
+        """
+        Yields ReportRow tuples in report order for lines reaching a checkpoint between date_from and
+        date_to (both default to today), optionally restricted to the given product ids.
+        """
+        date_to = date_to or date.today()
+        date_from = date_from or date_to
+        settings = settings or self.get_report_settings()
 
-                        for inv_line in inv_lines:
-                            if self.switch_on_so_line_is_on(inv_line):
-                                _logger.warning(
-                                    f'WARNING: SO Line #{inv_line.id} is omitted because the switch button is on.')
-                                continue
-                            line_data = self.process_invoice_line(
-                                inv_line, invoice, product, days_until_expiry)
+        try:
+            # One set-based query instead of a search per product and checkpoint
+            expiring_lines = self.query_expiring_lines(
+                date_from, date_to, settings.time_checkpoints, skip_notified, product_ids)
+        except Exception as e:
+            _logger.error(f"Error in formatting data: {e}")
+            raise
 
-                            inv_lines_data_list.append(line_data)
+        return self.build_report_rows(expiring_lines)
 
-                            self.create_scheduled_activity(
-                                inv_line, line_data[0], days_until_expiry)
+    def build_report_rows(self, expiring_lines):
+        """
+        Turns (inv_line_id, days_until_expiry, checkpoints) tuples into ReportRow tuples.
+        Invoice lines are loaded REPORT_CHUNK_SIZE at a time and dropped from the ORM cache
+        after each chunk, so memory depends on the chunk size rather than on invoice history.
+        """
+        try:
+            for chunk in split_every(self.REPORT_CHUNK_SIZE, expiring_lines):
+                report_line_values = self.load_report_line_values(
+                    list({line_id for line_id, _days, _checkpoints in chunk}))
+
+                for line_id, days_until_expiry, checkpoints in chunk:
+                    line_values = report_line_values[line_id]
+                    if self.switch_on_so_line_is_on(line_values):
+                        _logger.warning(
+                            f'WARNING: SO Line #{line_id} is omitted because the switch button is on.')
+                        continue
+                    line_data = self.process_invoice_line(
+                        line_values, days_until_expiry)
 
-                        report_data_dict[product][days_until_expiry] = inv_lines_data_list
+                    sale_order = self.get_sale_order_obj(line_values)
 
-            if not self.check_if_any_data_found(report_data_dict):
-                self.log_message('No data found', 'get_and_format_data')
-                return {}
+                    yield ReportRow(
+                        days_until_expiry, line_values['product_id'], tuple(line_data), line_id,
+                        sale_order['order_id'] if sale_order else None, line_values['expiration_date'],
+                        tuple(checkpoints), sale_order['salesperson_id'] if sale_order else None,
+                        sale_order['team_id'] if sale_order else None)
 
-            # raise UserError(f'report_data_dict:\n{report_data_dict}')
-            return report_data_dict
+                self.flush()
+                self.invalidate_cache()
         except Exception as e:
             _logger.error(f"Error in formatting data: {e}")
-            return {}
+            raise
 
     def apply_cell_formating(self, col_num, day_number, new_product_marker):
         format_dict = {}
@@ -273,93 +564,183 @@ class LicenseExpirationReport(models.Model):
             format_dict['top'] = 1
         return format_dict
 
-    def generate_xlsx_file(self, data_dict):
-        try:
-            # Create a new workbook using XlsxWriter
-            buffer = io.BytesIO()
-            workbook = xlsxwriter.Workbook(buffer, {'in_memory': True})
-
-            # Defining a bold format for the header
-            bold_format = workbook.add_format({'bold': True})
-
-            worksheet = workbook.add_worksheet()
-
-            # Seting the width of the columns
-            # Headers are in the first row of data_matrix and their length determines the column width
-            for col_num, header in enumerate(self.HEADER_VALUES_LIST):
-                if col_num in [0]:
-                    column_width = len(header) + 20
-                elif col_num in [9]:
-                    column_width = len(header) + 10
-                elif col_num in [2, 8]:
-                    column_width = len(header) + 30
-                else:
-                    column_width = len(header)
-
-                # Set the column width
-                worksheet.set_column(col_num, col_num, column_width)
+    def get_cell_format(self, workbook, format_cache, format_dict):
+        """
+        Returns a workbook format for the given properties, registering each distinct combination only once.
+        """
+        format_key = tuple(sorted(format_dict.items()))
+        if format_key not in format_cache:
+            format_cache[format_key] = workbook.add_format(format_dict)
+        return format_cache[format_key]
 
-                worksheet.write(0, col_num, header, bold_format)
+    def open_xlsx_workbook(self, settings=None, report_date=None):
+        """
+        Creates a workbook with the header row written and returns its writing state,
+        to be filled with write_xlsx_row and finished with close_xlsx_workbook.
+        """
+        # In constant memory mode XlsxWriter flushes every finished row to a temp file,
+        # so the workbook size no longer bounds the worker memory
+        settings = settings or self.get_report_settings()
+        constant_memory = settings.xlsx_constant_memory
+        if constant_memory:
+            output = tempfile.NamedTemporaryFile(suffix='.xlsx')
+            workbook = xlsxwriter.Workbook(
+                output.name, {'constant_memory': True})
+        else:
+            output = io.BytesIO()
+            workbook = xlsxwriter.Workbook(output, {'in_memory': True})
+        # A fixed creation date makes identical reports byte for byte identical
+        workbook.set_properties({'created': datetime.combine(
+            report_date or date.today(), datetime.min.time())})
+
+        # Defining a bold format for the header
+        bold_format = workbook.add_format({'bold': True})
+
+        worksheet = workbook.add_worksheet()
+
+        # Seting the width of the columns
+        # Headers are in the first row of data_matrix and their length determines the column width
+        for col_num, header in enumerate(self.HEADER_VALUES_LIST):
+            if col_num in [0]:
+                column_width = len(header) + 20
+            elif col_num in [9]:
+                column_width = len(header) + 10
+            elif col_num in [2, 8]:
+                column_width = len(header) + 30
+            else:
+                column_width = len(header)
+
+            # Set the column width
+            worksheet.set_column(col_num, col_num, column_width)
+
+            worksheet.write(0, col_num, header, bold_format)
 
-            row_num = 1
-            # raise UserError(f'list(data_dict.values()):\n{list(data_dict.values())}')
+        return {
+            'output': output,
+            'workbook': workbook,
+            'worksheet': worksheet,
+            'constant_memory': constant_memory,
+            'format_cache': {},
+            'row_num': 1,
+            'previous_product_id': None,
+        }
 
-            for product_dict in list(data_dict.values()):
-                new_product_marker = True
+    def write_xlsx_row(self, workbook_state, report_row):
+        # Example of report_row.values: ('Expires today', 'LBX-V3-ONB20UKB', 'LoxBox 20 Cart - (Black/Orange) for Tablets & Notebooks - UK Power', 'INV/2023/0736', '2023-02-23', 12, '2024-02-23', 'SO55291', '### School, Julie Chandler', 'M### M###', 13969)
+        new_product_marker = report_row.product_id != workbook_state['previous_product_id']
 
-                for day_number in self.get_time_checkpoints():
-                    matrix_of_invoice_lines = product_dict[day_number]
+        for col_num, cell_value in enumerate(report_row.values):
 
-                    # Example of line_list: ['Expires today', 'LBX-V3-ONB20UKB', 'LoxBox 20 Cart - (Black/Orange) for Tablets & Notebooks - UK Power', 'INV/2023/0736', '2023-02-23', 12, '2024-02-23', 'SO55291', '### School, Julie Chandler', 'M### M###', 13969]
-                    for line_list in matrix_of_invoice_lines:
+            format_to_use = self.get_cell_format(workbook_state['workbook'], workbook_state['format_cache'], self.apply_cell_formating(
+                col_num, report_row.days_until_expiry, new_product_marker))
 
-                        for col_num, cell_value in enumerate(line_list):
+            workbook_state['worksheet'].write(workbook_state['row_num'], col_num,
+                                              cell_value, format_to_use)
 
-                            format_to_use = workbook.add_format(
-                                self.apply_cell_formating(col_num, day_number, new_product_marker))
+        workbook_state['row_num'] += 1
+        workbook_state['previous_product_id'] = report_row.product_id
 
-                            worksheet.write(row_num, col_num,
-                                            cell_value, format_to_use)
+    def close_xlsx_workbook(self, workbook_state):
+        """
+        Returns the XLSX file content of the workbook.
+        In constant memory mode the finished file is read back from its temporary file in full,
+        so the peak memory is the size of one file, not of the workbook being built.
+        """
+        # Close the workbook to save changes
+        workbook_state['workbook'].close()
 
-                        row_num += 1
-                        new_product_marker = False
+        output = workbook_state['output']
+        if workbook_state['constant_memory']:
+            with output:
+                output.seek(0)
+                return output.read()
 
-            # Close the workbook to save changes
-            workbook.close()
+        # Get the binary data from the BytesIO buffer
+        return output.getvalue()
 
-            # Get the binary data from the BytesIO buffer
-            binary_data = buffer.getvalue()
-            return base64.b64encode(binary_data)
+    def generate_xlsx_file(self, report_rows, settings=None, max_rows=None, report_date=None):
+        """
+        Writes an iterable of ReportRow tuples to a workbook as they are produced, stopping after
+        max_rows rows when given so the rest of an iterator can go to the next file.
+        Returns the XLSX file content or None on error.
+        """
+        try:
+            workbook_state = self.open_xlsx_workbook(settings, report_date)
+            for report_row in itertools.islice(report_rows, max_rows):
+                self.write_xlsx_row(workbook_state, report_row)
+            return self.close_xlsx_workbook(workbook_state)
 
         except Exception as e:
             _logger.error(f"Error in generating XLSX file: {e}")
             return None
 
-    def send_email_with_attachment(self, subject, body, attachment):
+    def get_fan_out_group(self, report_row, fan_out_mode):
+        """
+        Returns the (model, id) of the salesperson or sales team a row is sent to, or None.
+        """
+        if fan_out_mode == 'salesperson' and report_row.salesperson_id:
+            return ('res.users', report_row.salesperson_id)
+        if fan_out_mode == 'team' and report_row.team_id:
+            return ('crm.team', report_row.team_id)
+        return None
+
+    def get_fan_out_recipients(self, group_keys):
+        """
+        Returns {group_key: (name, email)} for the fan-out groups, the email of a sales team
+        being the one of its team leader.
+        """
+        users = self.env['res.users'].browse(
+            [group_id for model, group_id in group_keys if model == 'res.users'])
+        teams = self.env['crm.team'].browse(
+            [group_id for model, group_id in group_keys if model == 'crm.team'])
+        recipients = {('res.users', user.id): (user.name, user.email)
+                      for user in users}
+        recipients.update({('crm.team', team.id): (team.name, team.user_id.email)
+                           for team in teams})
+        return recipients
+
+    def send_email_with_attachment(self, subject, body, attachments, settings=None, email_to=None):
+        """
+        Queues the report email with the given ir.attachment records. The mail queue cron sends it,
+        so the report run does not wait on the SMTP server.
+        Without email_to the configured recipient and CC addresses are used.
+        """
         try:
-            mail_mail = self.env['mail.mail'].create({
-                'email_to': self.get_config_param('licence_expiration_report.recipient_email'),
-                'email_from': self.get_config_param('licence_expiration_report.sender_email'),
-                'email_cc': self.get_config_param('licence_expiration_report.cc_email'),
-                'reply_to': self.get_config_param('licence_expiration_report.reply_to_email'),
+            settings = settings or self.get_report_settings()
+            self.env['mail.mail'].sudo().create({
+                'email_to': email_to or settings.recipient_email,
+                'email_from': settings.sender_email,
+                'email_cc': settings.cc_email if not email_to else False,
+                'reply_to': settings.reply_to_email,
                 'subject': subject,
                 'body_html': body,
-                'attachment_ids': [(0, 0, {'name': attachment[0], 'datas': attachment[1]})],
+                'attachment_ids': [(6, 0, attachments.ids)],
             })
-            mail_mail.send()
-            self.log_message('Email sent', 'send_email_with_attachment')
+            self.log_message('Email queued', 'send_email_with_attachment')
+            return True
 
         except Exception as e:
             _logger.error(f"Error in sending email: {e}")
+            return False
 
-    def prepare_email_content(self):
-        return {
+    def prepare_email_content(self, settings=None, download_links=()):
+        """
+        download_links: (file name, url) pairs of report files too large to be attached.
+        """
+        settings = settings or self.get_report_settings()
+        email_content = {
             'text_line_1': 'Hi,',
             'text_line_2': f'Please find attached the {self.HEADER_TEXT}.',
             'text_line_3': 'Kind regards,',
-            'text_line_4': self.get_config_param('licence_expiration_report.email_company_name'),
+            'text_line_4': settings.email_company_name,
+            'links_html': '',
             'table_width': 600
         }
+        if download_links:
+            email_content['text_line_2'] = f'Please find attached the {self.HEADER_TEXT}. Files too large to be attached can be downloaded from the links below.'
+            email_content['links_html'] = ''.join(
+                f'<p><a href="{url}">{name}</a></p>' for name, url in download_links)
+        return email_content
 
     def generate_email_html(self, email_content):
         return f"""
@@ -384,6 +765,7 @@ class LicenseExpirationReport(models.Model):
                             <p>{email_content['text_line_1']}</p>
                             </br>
                             <p>{email_content['text_line_2']}</p>
+                            {email_content['links_html']}
                             </br>
                             <p style="padding-top:20px;">{email_content['text_line_3']}</p>
                             <p>{email_content['text_line_4']}</p>
@@ -407,20 +789,274 @@ class LicenseExpirationReport(models.Model):
         """
         return email_html
 
-    def create_email_attachment(self, binary_data, subject):
+    def create_email_attachment(self, binary_data, subject, res_record=None):
+        """
+        Stores the report file once as an ir.attachment, linked to res_record when given.
+        An identical report, e.g. from a rerun on the same day, reuses the existing attachment.
+        Attachments with a res_model but no res_id are only visible to the superuser, so the lookup
+        and the creation run as sudo and the returned record is a sudo record.
+        """
         attachment_name = re.sub(r'[() /]', '_', f"{subject}.xlsx")
-        return (attachment_name, binary_data)
+        attachment_model = self.env['ir.attachment'].sudo()
+        checksum = attachment_model._compute_checksum(binary_data)
+        res_model = res_record._name if res_record else self._name
+        res_id = res_record.id if res_record else False
+        existing_attachment = attachment_model.search([
+            ('res_model', '=', res_model),
+            ('res_id', '=', res_id),
+            ('name', '=', attachment_name),
+            ('checksum', '=', checksum)], limit=1)
+        if existing_attachment:
+            return existing_attachment
+        return attachment_model.create({
+            'name': attachment_name,
+            'raw': binary_data,
+            'res_model': res_model,
+            'res_id': res_id,
+            'mimetype': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        })
 
-    def send_licence_expiration_report(self):
-        data_dict = self.get_and_format_data()
+    def send_report_email(self, subject, attachments, settings, email_to=None):
+        """
+        Emails the report files, replacing the ones above the attachment size limit by download links.
+        """
+        attachments = attachments.sudo()
+        size_limit = settings.attachment_size_limit * 1024 * 1024
+        linked_attachments = attachments.filtered(
+            lambda attachment: size_limit and attachment.file_size > size_limit)
+        download_links = [(attachment.name, self.get_attachment_download_url(attachment))
+                          for attachment in linked_attachments]
+        email_body = self.generate_email_html(
+            self.prepare_email_content(settings, download_links))
+
+        return self.send_email_with_attachment(
+            subject, email_body, attachments - linked_attachments, settings, email_to)
+
+    def store_xlsx_workbook(self, workbook_state, subject, part_index, stats):
+        """
+        Closes a workbook and stores it as an attachment, numbering the parts after the first one.
+        """
+        binary_data = self.close_xlsx_workbook(workbook_state)
+        stats.attachment_size += len(binary_data)
+        file_subject = f"{subject} - Part {part_index + 1}" if part_index else subject
+        return self.create_email_attachment(binary_data, file_subject)
 
-        if not data_dict:
+    def get_attachment_download_url(self, attachment):
+        base_url = self.env['ir.config_parameter'].sudo().get_param('web.base.url')
+        access_token = attachment.generate_access_token()[0]
+        return f'{base_url}/web/content/{attachment.id}?download=true&access_token={access_token}'
+
+    def get_horizon_checkpoints(self, horizon_days):
+        """
+        Returns the checkpoints covering every day from today up to horizon_days ahead
+        (or back, for a negative horizon).
+        """
+        if abs(horizon_days) > self.MAX_EXPORT_HORIZON_DAYS:
+            raise ValueError(
+                f'The horizon cannot exceed {self.MAX_EXPORT_HORIZON_DAYS} days')
+        step = 1 if horizon_days >= 0 else -1
+        return tuple(sorted(range(0, horizon_days + step, step)))
+
+    def get_export_rows(self, as_of_date, time_checkpoints, company_ids=None):
+        """
+        Yields the report rows as of a given date, for on-demand exports, restricted to the lines
+        of company_ids when given. Same-day requests for the configured checkpoints are served from
+        the daily snapshot, other checkpoint sets such as horizons are computed on the fly.
+        No activities are scheduled and nothing is recorded in the ledger.
+        """
+        if as_of_date == date.today() and tuple(sorted(set(time_checkpoints))) == self.get_report_settings().time_checkpoints:
+            return self.env['licence.expiration.report.snapshot'].get_snapshot_rows(
+                as_of_date, time_checkpoints, company_ids)
+        return self.build_report_rows(self.query_expiring_lines(
+            as_of_date, as_of_date, time_checkpoints, company_ids=company_ids))
+
+    def get_licensed_product_chunks(self):
+        self.env['product.product'].flush()
+        self.env.cr.execute("""
+            SELECT id FROM product_product WHERE x_licence_length_months > 0 ORDER BY id
+        """)
+        return split_every(self.PRODUCT_CHUNK_SIZE, [row[0] for row in self.env.cr.fetchall()])
+
+    def stage_report_chunk(self, settings, date_from, date_to, product_ids, stats=None):
+        """
+        Finds the not yet reported lines of one product range, schedules their activities and
+        stages them in the ledger, to be picked up by assemble_and_send_report.
+        Raises when the activities cannot be scheduled, so that the chunk cursor rolls back.
+        """
+        stats = stats or ReportRunStats()
+        with stats.measure('data_query', self.env.cr):
+            expiring_lines = self.query_expiring_lines(
+                date_from, date_to, settings.time_checkpoints, True, product_ids)
+
+        activity_candidates = []
+        notified_lines = []
+        with stats.measure('row_building', self.env.cr):
+            for _report_row in self.collect_notified_lines(self.collect_activity_candidates(
+                    self.build_report_rows(expiring_lines), activity_candidates), notified_lines):
+                pass
+
+        with stats.measure('activity', self.env.cr):
+            try:
+                stats.activity_count += len(
+                    self.create_scheduled_activities(activity_candidates))
+            except Exception as e:
+                # Staging the lines anyway would keep their activities from ever being retried,
+                # so the whole chunk is rolled back and picked up again by the next run
+                _logger.error(f"Error in scheduling activities: {e}")
+                raise
+
+        self.env['licence.expiration.report.ledger'].record_notified_lines(
+            notified_lines, date_to, state='staged')
+        return len(notified_lines)
+
+    def assemble_and_send_report(self, settings, today_date, stats=None):
+        """
+        Builds the report from every line staged in the ledger, emails it and marks the lines as sent.
+        Lines staged by an interrupted run are included too.
+        Returns 'done', 'no_data' or False when the report could not be sent.
+        """
+        stats = stats or ReportRunStats()
+        with stats.measure('data_query', self.env.cr):
+            staged_lines = self.query_staged_lines(today_date)
+        report_rows = stats.measure_rows(
+            self.build_report_rows(staged_lines), self.env.cr)
+
+        # Peeking at the first row detects an empty report without a second pass over the data
+        try:
+            first_row = next(report_rows, None)
+        except Exception as e:
+            # Already logged by build_report_rows
+            stats.errors.append(f"Error in formatting data: {e}")
+            return False
+        if first_row is None:
+            self.log_message('No data found', 'get_and_format_data')
             _logger.warning('No data to report.')
+            return 'no_data'
+
+        subject = f"{self.HEADER_TEXT} ({today_date.strftime('%d/%m/%y')})"
+        attachments = self.env['ir.attachment']
+        group_workbooks = {}
+        with stats.measure('xlsx', self.env.cr):
+            try:
+                # Single pass: every row goes to the consolidated workbook and, in fan-out mode,
+                # to the workbook of its salesperson or sales team.
+                # With xlsx_rows_per_file set, the consolidated report moves on to a new file when full.
+                workbook_state = self.open_xlsx_workbook(settings, today_date)
+                for report_row in itertools.chain([first_row], report_rows):
+                    if settings.xlsx_rows_per_file and workbook_state['row_num'] > settings.xlsx_rows_per_file:
+                        attachments |= self.store_xlsx_workbook(
+                            workbook_state, subject, len(attachments), stats)
+                        workbook_state = self.open_xlsx_workbook(
+                            settings, today_date)
+                    self.write_xlsx_row(workbook_state, report_row)
+
+                    group_key = self.get_fan_out_group(
+                        report_row, settings.fan_out_mode)
+                    if group_key:
+                        if group_key not in group_workbooks:
+                            group_workbooks[group_key] = self.open_xlsx_workbook(
+                                settings, today_date)
+                        self.write_xlsx_row(
+                            group_workbooks[group_key], report_row)
+                attachments |= self.store_xlsx_workbook(
+                    workbook_state, subject, len(attachments), stats)
+
+                group_attachments = {}
+                group_recipients = self.get_fan_out_recipients(
+                    list(group_workbooks))
+                for group_key, group_workbook_state in group_workbooks.items():
+                    group_subject = f"{self.HEADER_TEXT} - {group_recipients[group_key][0]} ({today_date.strftime('%d/%m/%y')})"
+                    group_attachments[group_key] = (group_subject, self.store_xlsx_workbook(
+                        group_workbook_state, group_subject, 0, stats))
+            except Exception as e:
+                _logger.error(f"Error in generating XLSX file: {e}")
+                stats.errors.append(f"Error in generating XLSX file: {e}")
+                return False
+
+        with stats.measure('mail', self.env.cr):
+            if not self.send_report_email(subject, attachments, settings):
+                stats.errors.append('Error in sending email')
+                return False
+
+            for group_key, (group_subject, group_attachment) in group_attachments.items():
+                group_name, group_email = group_recipients[group_key]
+                if not group_email:
+                    _logger.warning(
+                        f'WARNING: No email address for {group_name}, the report is only sent consolidated.')
+                    continue
+                if not self.send_report_email(group_subject, group_attachment, settings, group_email):
+                    stats.errors.append(
+                        f'Error in sending email to {group_name}')
+        self.env['licence.expiration.report.ledger'].mark_staged_lines_sent(
+            today_date)
+        return 'done'
+
+    def send_licence_expiration_report(self):
+        """
+        Reports every line that reached a checkpoint since the last successful run and was not
+        reported at that checkpoint yet, so days missed by a failed run are caught up.
+
+        Licensed products are processed PRODUCT_CHUNK_SIZE at a time, each chunk in its own cursor
+        that commits its activities and ledger entries. A run killed half way resumes from the
+        staged ledger entries instead of starting over. An advisory lock keeps runs from overlapping.
+        Every run is recorded with its per-stage timings in licence.expiration.report.run.
+        """
+        settings = self.get_report_settings()
+        today_date = date.today()
+        report_run = self.env['licence.expiration.report.run']
+
+        self.env.cr.execute(
+            "SELECT pg_try_advisory_xact_lock(%s)", (self.RUN_LOCK_KEY,))
+        if not self.env.cr.fetchone()[0]:
+            _logger.warning(
+                'Licence Expiration Report is already running, skipping this run.')
+            report_run.start_run(
+                today_date, time_checkpoints=settings.time_checkpoints, state='skipped')
             return
 
-        binary_data = self.generate_xlsx_file(data_dict)
-        subject = f"{self.HEADER_TEXT} ({date.today().strftime('%d/%m/%y')})"
-        email_body = self.generate_email_html(self.prepare_email_content())
-        attachment = self.create_email_attachment(binary_data, subject)
+        date_from = self.get_catch_up_date_from(today_date)
+        run_id = report_run.start_run(
+            today_date, date_from, settings.time_checkpoints)
+        stats = ReportRunStats()
+        run_state = False
 
-        self.send_email_with_attachment(subject, email_body, attachment)
+        try:
+            for product_ids in self.get_licensed_product_chunks():
+                try:
+                    with self.pool.cursor() as chunk_cr:
+                        chunk_env = api.Environment(
+                            chunk_cr, self.env.uid, self.env.context)
+                        chunk_env['account.move'].stage_report_chunk(
+                            settings, date_from, today_date, product_ids, stats)
+                except Exception as e:
+                    # The next run covers this window again, as the last success date is not moved
+                    _logger.error(
+                        f"Error in staging products #{product_ids[0]}-#{product_ids[-1]}: {e}")
+                    stats.errors.append(
+                        f"Error in staging products #{product_ids[0]}-#{product_ids[-1]}: {e}")
+
+            # The cron transaction started before the chunks committed, so it cannot see their entries
+            with self.pool.cursor() as assembly_cr:
+                assembly_env = api.Environment(
+                    assembly_cr, self.env.uid, self.env.context)
+                run_state = assembly_env['account.move'].assemble_and_send_report(
+                    settings, today_date, stats)
+                if run_state and not stats.errors:
+                    assembly_env['account.move'].set_last_success_date(
+                        today_date)
+
+            # Materialises today's report for the exports of the day
+            try:
+                with self.pool.cursor() as snapshot_cr:
+                    snapshot_env = api.Environment(
+                        snapshot_cr, self.env.uid, self.env.context)
+                    for _report_row in snapshot_env['licence.expiration.report.snapshot'].get_snapshot_rows(
+                            today_date, settings.time_checkpoints):
+                        pass
+            except Exception as e:
+                _logger.error(f"Error in building the report snapshot: {e}")
+        except Exception as e:
+            stats.errors.append(str(e))
+            raise
+        finally:
+            report_run.finish_run(run_id, stats, run_state or 'failed')
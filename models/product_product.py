@@ -0,0 +1,21 @@
+from odoo import models
+
+
+class ProductProduct(models.Model):
+    _inherit = 'product.product'
+
+    def write(self, vals):
+        result = super().write(vals)
+        if 'x_licence_length_months' in vals:
+            # The stored licence expiration dates of the product lines are recomputed on flush
+            self.env['account.move.line'].flush()
+            self.env.cr.execute("""
+                SELECT id FROM account_move_line WHERE product_id = ANY(%s)
+            """, (self.ids,))
+            line_ids = [row[0] for row in self.env.cr.fetchall()]
+            # A product that becomes licensed brings its invoice history into the renewal index
+            self.env['account.move.line']._update_licence_renewal_index(
+                renewed_line_ids=line_ids)
+            self.env['licence.expiration.report.snapshot'].refresh_snapshot_lines(
+                line_ids)
+        return result
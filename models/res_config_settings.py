@@ -1,4 +1,34 @@
-from odoo import fields, models
+from odoo import api, fields, models, _
+from odoo.exceptions import ValidationError
+from collections import namedtuple
+import re
+
+CONFIG_PARAM_PREFIX = 'licence_expiration_report.'
+
+# Typed, immutable view of the settings below, loaded once per report run
+ReportSettings = namedtuple('ReportSettings', [
+    'recipient_email', 'sender_email', 'cc_email', 'reply_to_email',
+    'time_checkpoints', 'email_company_name', 'xlsx_constant_memory',
+    'xlsx_rows_per_file', 'attachment_size_limit', 'fan_out_mode',
+])
+
+
+def parse_time_checkpoints(time_string):
+    """
+    Parses a comma separated checkpoint string such as "14, 30, -7, 30".
+    Returns a (checkpoints, invalid_entries) pair, where checkpoints is a sorted tuple of unique integers.
+    """
+    checkpoints = set()
+    invalid_entries = []
+    for time_str in (time_string or '').split(','):
+        time_str = time_str.strip()
+        if not time_str:
+            continue
+        if re.match(r"-?\d+$", time_str):
+            checkpoints.add(int(time_str))
+        else:
+            invalid_entries.append(time_str)
+    return tuple(sorted(checkpoints)), invalid_entries
 
 
 class ResConfigSettings(models.TransientModel):
@@ -21,3 +51,70 @@ class ResConfigSettings(models.TransientModel):
 
     email_company_name = fields.Char(string='Email Company Name', config_parameter='licence_expiration_report.email_company_name',
                                      help='Company name added to the email')
+
+    xlsx_constant_memory = fields.Boolean(string='Low Memory XLSX Generation', config_parameter='licence_expiration_report.xlsx_constant_memory',
+                                          help='Streams the report rows to a temporary file instead of building the whole workbook in memory. '
+                                               'The finished file is still read into memory once to be attached, '
+                                               'use Rows per XLSX File to bound its size')
+
+    xlsx_rows_per_file = fields.Integer(string='Rows per XLSX File', config_parameter='licence_expiration_report.xlsx_rows_per_file',
+                                        help='Splits the report into several files of at most this many rows. 0 keeps a single file')
+
+    attachment_size_limit = fields.Integer(string='Attachment Size Limit (MB)', config_parameter='licence_expiration_report.attachment_size_limit',
+                                           help='Report files larger than this are sent as a download link instead of an attachment. 0 means no limit')
+
+    fan_out_mode = fields.Selection([
+        ('none', 'Consolidated Only'),
+        ('salesperson', 'Per Salesperson'),
+        ('team', 'Per Sales Team'),
+    ], string='Report Fan-Out', default='none', config_parameter='licence_expiration_report.fan_out_mode',
+        help='Also sends each salesperson, or each sales team leader, a report with only their own expiring licences')
+
+    @api.constrains('time_checkpoints')
+    def _check_time_checkpoints(self):
+        for settings in self:
+            _checkpoints, invalid_entries = parse_time_checkpoints(
+                settings.time_checkpoints)
+            if invalid_entries:
+                raise ValidationError(_('Invalid time checkpoints: %s. Use whole numbers of days, e.g. "-7, 14, 30".')
+                                      % ', '.join(invalid_entries))
+
+    def set_values(self):
+        super().set_values()
+        # The report keeps a cached snapshot of these settings
+        self.env['account.move'].clear_caches()
+
+    @api.model
+    def load_report_settings(self):
+        """
+        Reads every licence expiration report parameter and returns a ReportSettings snapshot.
+        """
+        get_param = self.env['ir.config_parameter'].sudo().get_param
+        time_checkpoints, _invalid_entries = parse_time_checkpoints(
+            get_param(CONFIG_PARAM_PREFIX + 'time_checkpoints'))
+        return ReportSettings(
+            recipient_email=get_param(
+                CONFIG_PARAM_PREFIX + 'recipient_email') or '',
+            sender_email=get_param(CONFIG_PARAM_PREFIX + 'sender_email') or '',
+            cc_email=get_param(CONFIG_PARAM_PREFIX + 'cc_email') or '',
+            reply_to_email=get_param(
+                CONFIG_PARAM_PREFIX + 'reply_to_email') or '',
+            time_checkpoints=time_checkpoints,
+            email_company_name=get_param(
+                CONFIG_PARAM_PREFIX + 'email_company_name') or '',
+            xlsx_constant_memory=get_param(
+                CONFIG_PARAM_PREFIX + 'xlsx_constant_memory') == 'True',
+            xlsx_rows_per_file=self.parse_int_param(
+                get_param(CONFIG_PARAM_PREFIX + 'xlsx_rows_per_file')),
+            attachment_size_limit=self.parse_int_param(
+                get_param(CONFIG_PARAM_PREFIX + 'attachment_size_limit')),
+            fan_out_mode=get_param(
+                CONFIG_PARAM_PREFIX + 'fan_out_mode') or 'none',
+        )
+
+    @api.model
+    def parse_int_param(self, value):
+        try:
+            return max(int(value or 0), 0)
+        except ValueError:
+            return 0
@@ -0,0 +1,12 @@
+from odoo import models
+
+
+class SaleOrderLine(models.Model):
+    _inherit = 'sale.order.line'
+
+    def write(self, vals):
+        result = super().write(vals)
+        if 'x_omit_from_licence_expiration_report' in vals:
+            self.env['licence.expiration.report.snapshot'].refresh_snapshot_lines(
+                self.invoice_lines.ids)
+        return result
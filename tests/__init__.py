@@ -0,0 +1,4 @@
+from . import test_benchmark
+from . import test_query_modes
+from . import test_renewal_index
+from . import test_report_queries
@@ -0,0 +1,100 @@
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+from datetime import date, timedelta
+import dateutil.relativedelta
+
+
+class LicenceExpirationReportCommon(AccountTestInvoicingCommon):
+    LICENCE_LENGTHS = (12, 24, 36)
+    LINES_PER_PRODUCT = 100
+    LINES_PER_INVOICE = 10
+    # Every nth sale order line is flagged to be omitted from the report
+    OMIT_EVERY = 20
+
+    @classmethod
+    def setUpClass(cls, chart_template_ref=None):
+        super().setUpClass(chart_template_ref=chart_template_ref)
+        cls.env.user.groups_id = [
+            (4, cls.env.ref('sales_team.group_sale_manager').id)]
+        cls.report = cls.env['account.move']
+        cls.customer = cls.env['res.partner'].create({
+            'name': 'Licence Customer',
+            'user_id': cls.env.uid,
+        })
+        cls.product_batch = 0
+
+    @classmethod
+    def create_licensed_products(cls, product_count):
+        """
+        Creates product_count licensed products, spread evenly over LICENCE_LENGTHS.
+        Returns {licence length: product.product records}.
+        """
+        cls.product_batch += 1
+        products = cls.env['product.product'].create([{
+            'name': f'Licence Product {cls.product_batch}-{index}',
+            'default_code': f'LIC-{cls.product_batch:03d}-{index:06d}',
+            'type': 'service',
+            'list_price': 100.0,
+            'x_licence_length_months': cls.LICENCE_LENGTHS[index % len(cls.LICENCE_LENGTHS)],
+        } for index in range(max(len(cls.LICENCE_LENGTHS), product_count))])
+        return {licence_length_months: products.filtered(
+            lambda product: product.x_licence_length_months == licence_length_months)
+            for licence_length_months in cls.LICENCE_LENGTHS}
+
+    @classmethod
+    def create_licensed_invoices(cls, line_count, time_checkpoints=(14, 30, 60, 90)):
+        """
+        Creates licensed products, confirmed sale orders and posted customer invoices with line_count
+        invoice lines. Every invoice holds products of a single licence length, so all its lines
+        expire on the same checkpoint counted from today, and every length meets every checkpoint.
+        Each invoice has its own delivery address, so no line is a renewal of another one.
+        Returns the posted account.move records.
+        """
+        today_date = date.today()
+        products_by_length = cls.create_licensed_products(
+            line_count // cls.LINES_PER_PRODUCT)
+
+        invoice_starts = range(0, line_count, cls.LINES_PER_INVOICE)
+        delivery_addresses = cls.env['res.partner'].create([{
+            'name': f'Licence Site {index}',
+            'type': 'delivery',
+            'parent_id': cls.customer.id,
+        } for index in range(len(invoice_starts))])
+
+        invoice_vals_list = []
+        for invoice_index, first_line in enumerate(invoice_starts):
+            licence_length_months = cls.LICENCE_LENGTHS[invoice_index % len(
+                cls.LICENCE_LENGTHS)]
+            checkpoint = time_checkpoints[invoice_index // len(
+                cls.LICENCE_LENGTHS) % len(time_checkpoints)]
+            length_products = products_by_length[licence_length_months]
+            line_products = [length_products[line_index % len(length_products)]
+                             for line_index in range(first_line, min(first_line + cls.LINES_PER_INVOICE, line_count))]
+            sale_order = cls.env['sale.order'].create({
+                'partner_id': cls.customer.id,
+                'partner_shipping_id': delivery_addresses[invoice_index].id,
+                'order_line': [(0, 0, {
+                    'product_id': product.id,
+                    'product_uom_qty': 1,
+                    'x_omit_from_licence_expiration_report': (first_line + line_index) % cls.OMIT_EVERY == 0,
+                }) for line_index, product in enumerate(line_products)],
+            })
+            sale_order.action_confirm()
+
+            invoice_date = today_date + timedelta(days=checkpoint) - \
+                dateutil.relativedelta.relativedelta(
+                    months=licence_length_months)
+            invoice_vals_list.append({
+                'move_type': 'out_invoice',
+                'partner_id': cls.customer.id,
+                'partner_shipping_id': delivery_addresses[invoice_index].id,
+                'invoice_date': invoice_date,
+                'invoice_line_ids': [(0, 0, {
+                    'product_id': so_line.product_id.id,
+                    'quantity': 1,
+                    'price_unit': so_line.price_unit,
+                    'sale_line_ids': [(6, 0, so_line.ids)],
+                }) for so_line in sale_order.order_line],
+            })
+        invoices = cls.env['account.move'].create(invoice_vals_list)
+        invoices.action_post()
+        return invoices
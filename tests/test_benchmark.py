@@ -0,0 +1,135 @@
+from odoo.tests import tagged
+from .common import LicenceExpirationReportCommon
+import json
+import logging
+import os
+import time
+import tracemalloc
+
+_logger = logging.getLogger(__name__)
+
+
+class BenchmarkRollback(Exception):
+    """Raised to roll back the data of a benchmark size or the changes of a memory measurement run."""
+
+
+@tagged('post_install', '-at_install', '-standard', 'licence_expiration_benchmark')
+class TestReportBenchmark(LicenceExpirationReportCommon):
+    """
+    Benchmarks the report stages on synthetic data. Not part of the standard test run, run it on
+    a local database with e.g. --test-tags licence_expiration_benchmark
+
+    Environment variables:
+    LICENCE_EXPIRATION_BENCHMARK_SIZES: comma separated line counts, 1000,10000,100000 by default
+    LICENCE_EXPIRATION_BENCHMARK_BASELINE: JSON file of earlier results to compare with
+    LICENCE_EXPIRATION_BENCHMARK_MAX_REGRESSION: allowed growth over the baseline, 0.2 (20%) by default
+    LICENCE_EXPIRATION_BENCHMARK_OUTPUT: JSON file the results are written to, to be used as baseline
+    """
+    BENCHMARK_SIZES = '1000,10000,100000'
+    BENCHMARK_CHECKPOINTS = (14, 30, 60, 90)
+
+    def measure_stage(self, stage_results, stage_name, stage_function):
+        """
+        Runs stage_function twice: once under tracemalloc for its peak Python memory, with its
+        database changes rolled back, then once for its wall time and SQL query count.
+        Returns the result of the timed run.
+        """
+        self.env['base'].flush()
+        self.report.invalidate_cache()
+        tracemalloc.start()
+        try:
+            with self.env.cr.savepoint():
+                stage_function()
+                raise BenchmarkRollback()
+        except BenchmarkRollback:
+            pass
+        finally:
+            _current_memory, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        self.report.invalidate_cache()
+        query_count = self.env.cr.sql_log_count
+        start_time = time.perf_counter()
+        result = stage_function()
+        wall_time = time.perf_counter() - start_time
+        stage_results[stage_name] = {
+            'wall_time': round(wall_time, 3),
+            'query_count': self.env.cr.sql_log_count - query_count,
+            'peak_memory_kb': peak_memory // 1024,
+        }
+        return result
+
+    def benchmark_report_pipeline(self, line_count):
+        settings = self.report.get_report_settings()._replace(
+            time_checkpoints=self.BENCHMARK_CHECKPOINTS)
+        stage_results = {'line_count': line_count}
+        self.create_licensed_invoices(line_count, self.BENCHMARK_CHECKPOINTS)
+
+        def build_rows():
+            activity_candidates = []
+            report_rows = list(self.report.collect_activity_candidates(
+                self.report.get_and_format_data(settings), activity_candidates))
+            return report_rows, activity_candidates
+
+        report_rows, activity_candidates = self.measure_stage(
+            stage_results, 'get_and_format_data', build_rows)
+        stage_results['row_count'] = len(report_rows)
+        self.assertEqual(len(report_rows), line_count - line_count // self.OMIT_EVERY,
+                         'Every line that is not omitted expires on a checkpoint')
+        self.measure_stage(stage_results, 'generate_xlsx_file',
+                           lambda: self.report.generate_xlsx_file(report_rows, settings))
+        self.measure_stage(stage_results, 'create_scheduled_activities',
+                           lambda: self.report.create_scheduled_activities(activity_candidates))
+        return stage_results
+
+    def check_regressions(self, results, baseline, max_regression):
+        """
+        Returns a message for every stage whose wall time, query count or peak memory grew by more
+        than max_regression over the baseline.
+        """
+        regressions = []
+        for size_results in results:
+            size_baseline = baseline.get(str(size_results['line_count']))
+            if not size_baseline:
+                continue
+            for stage_name, stage_result in size_results.items():
+                if not isinstance(stage_result, dict) or stage_name not in size_baseline:
+                    continue
+                for metric, value in stage_result.items():
+                    reference = size_baseline[stage_name].get(metric)
+                    if reference and value > reference * (1 + max_regression):
+                        regressions.append(
+                            f"{size_results['line_count']} lines, {stage_name}: {metric} {value} > {reference}")
+        return regressions
+
+    def test_report_benchmark(self):
+        sizes = [int(size) for size in os.environ.get(
+            'LICENCE_EXPIRATION_BENCHMARK_SIZES', self.BENCHMARK_SIZES).split(',')]
+        results = []
+        for line_count in sizes:
+            with self.subTest(line_count=line_count):
+                # Each size runs on its own data, the lines of the previous sizes are rolled back
+                try:
+                    with self.env.cr.savepoint():
+                        results.append(
+                            self.benchmark_report_pipeline(line_count))
+                        raise BenchmarkRollback()
+                except BenchmarkRollback:
+                    pass
+                _logger.info('Licence Expiration Report benchmark: %s',
+                             json.dumps(results[-1]))
+
+        output_path = os.environ.get('LICENCE_EXPIRATION_BENCHMARK_OUTPUT')
+        if output_path:
+            with open(output_path, 'w') as output_file:
+                json.dump({str(size_results['line_count']): size_results
+                           for size_results in results}, output_file, indent=2)
+
+        baseline_path = os.environ.get('LICENCE_EXPIRATION_BENCHMARK_BASELINE')
+        if baseline_path:
+            with open(baseline_path) as baseline_file:
+                baseline = json.load(baseline_file)
+            regressions = self.check_regressions(results, baseline, float(
+                os.environ.get('LICENCE_EXPIRATION_BENCHMARK_MAX_REGRESSION', '0.2')))
+            self.assertFalse(
+                regressions, 'Licence Expiration Report performance regressions:\n%s' % '\n'.join(regressions))
@@ -0,0 +1,73 @@
+from odoo.tests import tagged
+from .common import LicenceExpirationReportCommon
+from datetime import date, timedelta
+
+
+@tagged('post_install', '-at_install')
+class TestQueryModes(LicenceExpirationReportCommon):
+
+    def query_expiring_lines_by_length(self, date_from, date_to, time_checkpoints):
+        """
+        Reference for query_expiring_lines: groups the licensed products by licence length, runs one
+        product_id IN (...) search per length and checkpoint and splits the lines back out by product.
+        Archived products are included, like in the report.
+        """
+        products = self.env['product.product'].with_context(active_test=False).search(
+            [('x_licence_length_months', '>', 0)])
+        products_by_length = {}
+        for product in products:
+            products_by_length.setdefault(
+                product.x_licence_length_months, []).append(product.id)
+
+        lines_by_product = {}
+        line_checkpoints = {}
+        for product_ids in products_by_length.values():
+            for position, checkpoint in enumerate(time_checkpoints):
+                for line in self.env['account.move.line'].search_read([
+                    ('product_id', 'in', product_ids),
+                    ('move_id.state', '=', 'posted'),
+                    ('move_id.move_type', '=', 'out_invoice'),
+                    ('exclude_from_invoice_tab', '=', False),
+                    ('licence_renewal_line_id', '=', False),
+                    ('licence_expiration_date', '>=', date_from + timedelta(days=checkpoint)),
+                    ('licence_expiration_date', '<=', date_to + timedelta(days=checkpoint)),
+                ], ['product_id', 'move_id', 'date', 'move_name', 'licence_expiration_date']):
+                    if line['id'] not in line_checkpoints:
+                        lines_by_product.setdefault(
+                            line['product_id'][0], []).append(dict(line, position=position))
+                        line_checkpoints[line['id']] = []
+                    line_checkpoints[line['id']].append(checkpoint)
+
+        # Report order: default_code (empty last), name and id of the product
+        ordered_products = sorted(products.filtered(lambda product: product.id in lines_by_product), key=lambda product: (
+            not product.default_code, product.default_code or '', product.name, product.id))
+        expiring_lines = []
+        for product in ordered_products:
+            product_lines = lines_by_product[product.id]
+            # Checkpoint, then invoice date, name and id descending, then line id
+            product_lines.sort(key=lambda line: line['id'])
+            product_lines.sort(key=lambda line: (line['date'], line['move_name'] or '', line['move_id'][0]),
+                               reverse=True)
+            product_lines.sort(key=lambda line: line['position'])
+            expiring_lines.extend(
+                (line['id'], (line['licence_expiration_date'] - date_to).days, line_checkpoints[line['id']])
+                for line in product_lines)
+        return expiring_lines
+
+    def test_grouped_by_length_matches_report_query(self):
+        time_checkpoints = (14, 30, 60, 90)
+        invoices = self.create_licensed_invoices(120, time_checkpoints)
+        archived_product = invoices[0].invoice_line_ids[0].product_id
+        archived_product.active = False
+
+        today_date = date.today()
+        for date_from in (today_date, today_date - timedelta(days=20)):
+            self.env['base'].flush()
+            report_lines = [tuple(line) for line in self.report.query_expiring_lines(
+                date_from, today_date, time_checkpoints)]
+            grouped_lines = [tuple(line) for line in self.query_expiring_lines_by_length(
+                date_from, today_date, time_checkpoints)]
+            self.assertEqual(len(report_lines), 120)
+            self.assertEqual(report_lines, grouped_lines)
+            self.assertIn(archived_product, self.env['account.move.line'].browse(
+                [line[0] for line in report_lines]).product_id)
@@ -0,0 +1,42 @@
+from odoo.tests import tagged
+from .common import LicenceExpirationReportCommon
+from datetime import date
+import dateutil.relativedelta
+
+
+@tagged('post_install', '-at_install')
+class TestRenewalIndex(LicenceExpirationReportCommon):
+
+    def create_invoice(self, product, invoice_date):
+        return self.env['account.move'].create({
+            'move_type': 'out_invoice',
+            'partner_id': self.customer.id,
+            'partner_shipping_id': self.customer.id,
+            'invoice_date': invoice_date,
+            'invoice_line_ids': [(0, 0, {
+                'product_id': product.id,
+                'quantity': 1,
+                'price_unit': 100.0,
+            })],
+        })
+
+    def test_back_dated_invoice_is_renewed(self):
+        product = self.create_licensed_products(0)[12][0]
+        today_date = date.today()
+        renewal = self.create_invoice(product, today_date)
+        renewal.action_post()
+        # Posted after its renewal, but dated a year before it
+        renewed = self.create_invoice(
+            product, today_date - dateutil.relativedelta.relativedelta(months=12))
+        renewed.action_post()
+
+        self.assertEqual(renewed.invoice_line_ids.licence_renewal_line_id,
+                         renewal.invoice_line_ids)
+        self.assertFalse(self.report.query_expiring_lines(
+            today_date, today_date, (0,), line_ids=renewed.invoice_line_ids.ids))
+
+        renewal.button_draft()
+        renewal.button_cancel()
+        self.assertFalse(renewed.invoice_line_ids.licence_renewal_line_id)
+        self.assertEqual(len(self.report.query_expiring_lines(
+            today_date, today_date, (0,), line_ids=renewed.invoice_line_ids.ids)), 1)
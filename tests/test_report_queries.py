@@ -0,0 +1,37 @@
+from odoo.tests import tagged
+from .common import LicenceExpirationReportCommon
+
+
+@tagged('post_install', '-at_install')
+class TestReportQueries(LicenceExpirationReportCommon):
+
+    def count_queries(self, function, *args):
+        self.env['base'].flush()
+        self.report.invalidate_cache()
+        query_count = self.env.cr.sql_log_count
+        result = function(*args)
+        return self.env.cr.sql_log_count - query_count, result
+
+    def test_row_building_query_count_is_fixed(self):
+        small_lines = self.create_licensed_invoices(20).invoice_line_ids
+        large_lines = self.create_licensed_invoices(40).invoice_line_ids
+
+        small_count, small_values = self.count_queries(
+            self.report.load_report_line_values, small_lines.ids)
+        large_count, large_values = self.count_queries(
+            self.report.load_report_line_values, large_lines.ids)
+        self.assertEqual(len(small_values), 20)
+        self.assertEqual(len(large_values), 40)
+        self.assertEqual(small_count, large_count,
+                         'Loading twice as many lines must not add queries')
+
+        small_count, small_rows = self.count_queries(lambda line_ids: list(self.report.build_report_rows(
+            [(line_id, 0, [0]) for line_id in line_ids])), small_lines.ids)
+        large_count, large_rows = self.count_queries(lambda line_ids: list(self.report.build_report_rows(
+            [(line_id, 0, [0]) for line_id in line_ids])), large_lines.ids)
+        # Every OMIT_EVERY-th line of each batch is omitted
+        self.assertEqual(len(small_rows), 20 - 20 // self.OMIT_EVERY)
+        self.assertEqual(len(large_rows), 40 - 40 // self.OMIT_EVERY)
+        self.assertEqual(small_count, large_count,
+                         'Building twice as many rows must not add queries')
+        self.assertTrue(all(report_row.sale_order_id for report_row in large_rows))
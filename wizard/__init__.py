@@ -0,0 +1,2 @@
+from . import licence_expiration_report_export
+from . import licence_expiration_report_replay
@@ -0,0 +1,52 @@
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+from ..models.res_config_settings import parse_time_checkpoints
+from werkzeug.urls import url_encode
+
+
+class LicenceExpirationReportExport(models.TransientModel):
+    _name = 'licence.expiration.report.export'
+    _description = 'Licence Expiration Report Export'
+
+    as_of_date = fields.Date(
+        string='As of', required=True, default=fields.Date.context_today)
+    selection_mode = fields.Selection([
+        ('horizon', 'Expiring Within'),
+        ('checkpoints', 'Time Checkpoints'),
+    ], string='Lines', required=True, default='horizon')
+    horizon_days = fields.Integer(
+        string='Horizon (Days)', default=45,
+        help='Exports every licence expiring between the as of date and this many days later')
+    time_checkpoints = fields.Char(
+        string='Time Checkpoints', help='Comma separated numbers e.g. "14, 30, 60, 90"')
+    file_format = fields.Selection([
+        ('xlsx', 'XLSX'),
+        ('csv', 'CSV'),
+    ], string='Format', required=True, default='xlsx')
+
+    @api.onchange('selection_mode')
+    def _onchange_selection_mode(self):
+        if self.selection_mode == 'checkpoints' and not self.time_checkpoints:
+            self.time_checkpoints = ', '.join(
+                str(checkpoint) for checkpoint in self.env['account.move'].get_time_checkpoints())
+
+    def action_export(self):
+        self.ensure_one()
+        params = {
+            'as_of': fields.Date.to_string(self.as_of_date),
+            'file_format': self.file_format,
+        }
+        if self.selection_mode == 'horizon':
+            params['horizon'] = self.horizon_days
+        else:
+            checkpoints, invalid_entries = parse_time_checkpoints(
+                self.time_checkpoints)
+            if invalid_entries or not checkpoints:
+                raise UserError(
+                    _('Enter whole numbers of days, e.g. "-7, 14, 30".'))
+            params['checkpoints'] = self.time_checkpoints
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/licence_expiration_report/export?{url_encode(params)}',
+            'target': 'self',
+        }
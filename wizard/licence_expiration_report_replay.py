@@ -0,0 +1,28 @@
+from odoo import fields, models, _
+
+
+class LicenceExpirationReportReplay(models.TransientModel):
+    _name = 'licence.expiration.report.replay'
+    _description = 'Licence Expiration Report Replay'
+
+    date_from = fields.Date(
+        string='From', required=True, default=fields.Date.context_today)
+    date_to = fields.Date(
+        string='To', required=True, default=fields.Date.context_today)
+    dry_run = fields.Boolean(
+        string='Dry Run', default=True,
+        help='Only generates the daily reports, without scheduling activities or sending emails')
+    create_activities = fields.Boolean(string='Schedule Activities')
+    send_email = fields.Boolean(string='Send Emails')
+
+    def action_replay(self):
+        self.ensure_one()
+        attachments = self.env['account.move'].replay_licence_expiration_report(
+            self.date_from, self.date_to, self.create_activities, self.send_email, self.dry_run)
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Replayed Licence Expiration Reports'),
+            'res_model': 'ir.attachment',
+            'view_mode': 'tree,form',
+            'domain': [('id', 'in', attachments.ids)],
+        }